@@ -0,0 +1,337 @@
+"""
+Anytime heuristics for the assignment models.
+
+greedy builds a feasible assignment in one pass: students are placed in order
+of regret, the cost gap between their best and second best time slot, so the
+students with the most to lose choose first. A student who finds no free
+seat that fits (one needing several slots, say) is then placed along an
+augmenting path of the slot graph below, which moves other students on to a
+free seat. improve then runs local search until no improving move is left or
+the deadline passes.
+
+The local search works on a graph over the time slots. Arc s -> t carries the
+cheapest way to move one student from s to t, and an extra node Z has arcs
+Z -> s into every slot and t -> Z out of every slot with a free seat. A
+negative cycle through Z is then an ejection chain ending in a free seat
+(a plain relocation is the chain of one move), and a negative cycle without
+Z is a cyclic exchange (a pairwise swap is the cycle of two moves).
+Bellman-Ford over the slots finds one in O(M^3), independent of N.
+
+Around an optimal assignment the same graph answers capacity questions:
+shortest paths from Z price one more seat in each slot (seat_values), and
+shortest paths to Z move the students out of a shrunk slot (evict).
+"""
+import time
+from collections import deque
+
+import numpy as np
+
+EPS = 1e-9
+
+def membership(groups, M):
+    """
+    Returns the M x K 0/1 matrix of which slot is in which concurrent group.
+    """
+    P = np.zeros((M, len(groups)), dtype=np.int64)
+    for k, group in enumerate(groups):
+        P[list(group), k] = 1
+    return P
+
+def greedy(costs, caps, demands, groups=()):
+    """
+    costs: N x M array, costs[j, i] is the cost of giving student j slot i
+    caps: the capacity of each slot
+    demands: the number of slots each student needs
+    groups: tuples of slots no student may hold two of
+    Returns the N x M 0/1 assignment. Raises ValueError if a student cannot
+    be placed even by moving others, which without groups means no feasible
+    assignment exists.
+    """
+    N, M = costs.shape
+    P = membership(groups, M)
+    free = np.array(caps, dtype=np.int64)
+    x = np.zeros((N, M), dtype=bool)
+    ranked = np.argsort(costs, axis=1, kind='mergesort')
+    if M > 1:
+        best = costs[np.arange(N), ranked[:, 0]]
+        regret = costs[np.arange(N), ranked[:, 1]] - best
+    else:
+        regret = np.zeros(N)
+    short = []
+    for j in np.argsort(-regret, kind='mergesort').tolist():
+        need = demands[j]
+        used = np.zeros(len(groups), dtype=np.int64)
+        for i in ranked[j].tolist():
+            if not need:
+                break
+            if free[i] and not (used & P[i]).any():
+                x[j, i] = True
+                free[i] -= 1
+                used |= P[i]
+                need -= 1
+        short.extend(j for _ in range(need))
+    for j in short:
+        if not _augment(costs, caps, x, P, j):
+            raise ValueError('greedy could not place student {0}'.format(j))
+    return x
+
+def _augment(costs, caps, x, P, j):
+    """
+    Gives student j one more slot in x, in place, along a shortest (in
+    moves) augmenting path: j enters a slot it may take, and each slot on
+    the path passes one student on to the next, the last one into a free
+    seat. Returns False, leaving x as it was, if there is none.
+    """
+    M = costs.shape[1]
+    W, who = _move_graph(costs, caps, x, P)
+    enter = ~x[j]
+    if P.shape[1]:
+        enter &= P.dot(x[j].astype(np.int64).dot(P)) == 0
+    pred = {}
+    queue = deque()
+    for s in np.argsort(costs[j], kind='mergesort').tolist():
+        if enter[s]:
+            pred[s] = None
+            queue.append(s)
+    while queue:
+        u = queue.popleft()
+        if W[u, M] == 0:
+            break
+        for v in np.nonzero(W[u, :M] < np.inf)[0].tolist():
+            if v not in pred:
+                pred[v] = u
+                queue.append(v)
+    else:
+        return False
+    path = [u]
+    while pred[path[-1]] is not None:
+        path.append(pred[path[-1]])
+    path.reverse()
+    moves = [(who[u, v], u, v) for u, v in zip(path, path[1:])]
+    for k, u, v in moves:
+        x[k, u] = False
+        x[k, v] = True
+    x[j, path[0]] = True
+    # a student moved twice may end up in two slots of one group
+    moved = [j] + [k for k, _, _ in moves]
+    if (x[moved].astype(np.int64).dot(P) <= 1).all():
+        return True
+    x[j, path[0]] = False
+    for k, u, v in reversed(moves):
+        x[k, v] = False
+        x[k, u] = True
+    return False
+
+def objective(costs, x):
+    return costs[x].sum()
+
+def lower_bound(costs, demands):
+    """
+    Returns each student's cheapest slots summed, a bound that ignores caps
+    and concurrency.
+    """
+    d = np.asarray(demands)
+    s = np.sort(costs, axis=1)
+    return sum(s[j, :d[j]].sum() for j in range(len(s)))
+
+def _deltas(costs, x, P, G, s):
+    """
+    Returns the students in slot s and the cost of moving each of them to
+    every slot, inf where the move is not allowed.
+    """
+    js = np.nonzero(x[:, s])[0]
+    delta = (costs[js] - costs[js, s][:, np.newaxis]).astype(float)
+    blocked = x[js]
+    if G is not None:
+        # a concurrent group is taken if the student holds another of it
+        taken = (G[js] - P[s]) > 0
+        blocked = blocked | (taken.dot(P.T) > 0)
+    delta[blocked] = np.inf
+    return js, delta
+
+def _groups_held(x, P):
+    return x.astype(np.int64).dot(P) if P.shape[1] else None
+
+def _move_graph(costs, caps, x, P):
+    """
+    Returns the (M+1) x (M+1) arc costs of the slot graph, node M being Z,
+    and the student behind every slot to slot arc.
+    """
+    N, M = costs.shape
+    W = np.full((M+1, M+1), np.inf)
+    who = np.full((M, M), -1, dtype=np.int64)
+    G = _groups_held(x, P)
+    for s in range(M):
+        js, delta = _deltas(costs, x, P, G, s)
+        if not len(js):
+            continue
+        best = delta.argmin(axis=0)
+        W[s, :M] = delta[best, np.arange(M)]
+        who[s] = js[best]
+    W[M, :M] = 0
+    W[:M, M] = np.where(np.asarray(caps) > x.sum(axis=0), 0, np.inf)
+    np.fill_diagonal(W, np.inf)
+    return W, who
+
+def _negative_cycle(W):
+    """
+    Returns a negative cycle of W as a list of nodes, or None.
+    """
+    n = len(W)
+    dist = np.zeros(n)
+    pred = np.full(n, -1, dtype=np.int64)
+    for _ in range(n + 1):
+        cand = dist[:, np.newaxis] + W
+        best = cand.argmin(axis=0)
+        new = cand[best, np.arange(n)]
+        upd = new < dist - EPS
+        if not upd.any():
+            return None
+        dist[upd] = new[upd]
+        pred[upd] = best[upd]
+        cycle = _pred_cycle(pred)
+        if cycle is not None and \
+           sum(W[u, v] for u, v in zip(cycle, cycle[1:] + cycle[:1])) < -EPS:
+            return cycle
+    return None
+
+def _shortest_paths(W, source):
+    """
+    Returns the Bellman-Ford distances and predecessors from source in W,
+    which must have no negative cycle.
+    """
+    n = len(W)
+    dist = np.full(n, np.inf)
+    dist[source] = 0
+    pred = np.full(n, -1, dtype=np.int64)
+    for _ in range(n - 1):
+        cand = dist[:, np.newaxis] + W
+        best = cand.argmin(axis=0)
+        new = cand[best, np.arange(n)]
+        upd = new < dist - EPS
+        if not upd.any():
+            break
+        dist[upd] = new[upd]
+        pred[upd] = best[upd]
+    return dist, pred
+
+def _pred_cycle(pred):
+    """
+    Returns a cycle of the predecessor graph in forward order, or None.
+    """
+    state = [0 for _ in pred]
+    for v in range(len(pred)):
+        path = []
+        while v >= 0 and not state[v]:
+            state[v] = 1
+            path.append(v)
+            v = pred[v]
+        if v >= 0 and state[v] == 1:
+            cycle = path[path.index(v):]
+            cycle.reverse()
+            return cycle
+        for u in path:
+            state[u] = 2
+    return None
+
+def _chain_moves(costs, caps, x, P, cycle):
+    """
+    Returns the moves of as many copies of the chain along cycle as still
+    improve the objective, as (student, from, to) triples. Copy k moves the
+    k-th cheapest student along every arc, so the gains only shrink.
+    """
+    M = costs.shape[1]
+    G = _groups_held(x, P)
+    arcs = zip(cycle, cycle[1:] + cycle[:1])
+    limit = len(x)
+    steps = []
+    for u, v in arcs:
+        if v == M:
+            limit = min(limit, caps[u] - x[:, u].sum())
+        elif u < M:
+            js, delta = _deltas(costs, x, P, G, u)
+            order = np.argsort(delta[:, v], kind='mergesort')
+            steps.append((u, v, js[order], delta[order, v]))
+    limit = min([limit] + [len(js) for _, _, js, _ in steps])
+    gains = np.sum([d[:limit] for _, _, _, d in steps], axis=0)
+    count = max(1, (gains < -EPS).sum())
+    moves = [(j, u, v) for u, v, js, _ in steps for j in js[:count].tolist()]
+    if len(set(j for j, _, _ in moves)) < len(moves):
+        moves = [(js[0], u, v) for u, v, js, _ in steps]
+    return moves
+
+def improve(costs, caps, x, groups=(), deadline=None):
+    """
+    Applies improving ejection chains and exchanges to the assignment x in
+    place until none is left or time.time() passes deadline. Returns whether
+    the search ran out of improving moves.
+    """
+    M = costs.shape[1]
+    P = membership(groups, M)
+    while deadline is None or time.time() < deadline:
+        W, who = _move_graph(costs, caps, x, P)
+        cycle = _negative_cycle(W)
+        if cycle is None:
+            return True
+        moves = _chain_moves(costs, caps, x, P, cycle)
+        # a student holding several slots may be picked twice, which the
+        # arc costs do not account for
+        if len(set(j for j, _, _ in moves)) < len(moves):
+            return False
+        for j, u, v in moves:
+            x[j, u] = False
+            x[j, v] = True
+    return False
+
+def solve(costs, caps, demands, groups=(), budget=None):
+    """
+    Runs greedy and then improve for at most budget seconds. Returns the
+    assignment and whether it is optimal. Without concurrent groups the slot
+    graph is the residual graph of the transportation problem, so running out
+    of improving moves proves optimality.
+    """
+    deadline = None if budget is None else time.time() + budget
+    x = greedy(costs, caps, demands, groups)
+    done = improve(costs, caps, x, groups, deadline)
+    return x, done and not groups
+
+def seat_values(costs, caps, x, groups=()):
+    """
+    Returns the objective change one more seat in each slot would bring,
+    for an optimal assignment x. The best use of a new seat in slot i is the
+    cheapest ejection chain ending in it, the shortest path from Z to i, so
+    these are the dual prices of the slots' capacity rows.
+    """
+    M = costs.shape[1]
+    W, _ = _move_graph(costs, caps, x, membership(groups, M))
+    dist, _ = _shortest_paths(W, M)
+    return np.minimum(dist[:M], 0)
+
+def evict(costs, caps, x, groups=()):
+    """
+    Moves students out of the slots of x over their capacity in caps, in
+    place, one at a time along the cheapest ejection chain to a free seat.
+    Each chain is a shortest augmenting path, so an optimal x for the old
+    caps stays optimal among assignments for the new ones. Raises ValueError
+    if a slot cannot be brought down to its capacity.
+    """
+    M = costs.shape[1]
+    P = membership(groups, M)
+    caps = np.asarray(caps)
+    while True:
+        over = np.nonzero(x.sum(axis=0) > caps)[0]
+        if not len(over):
+            return
+        s = over[0]
+        W, who = _move_graph(costs, caps, x, P)
+        dist, pred = _shortest_paths(W, s)
+        if dist[M] == np.inf:
+            raise ValueError('no free seat for the students of slot '
+                             '{0}'.format(s))
+        path = [M]
+        while path[-1] != s:
+            path.append(pred[path[-1]])
+        path.reverse()
+        for u, v in zip(path, path[1:-1]):
+            x[who[u, v], u] = False
+            x[who[u, v], v] = True
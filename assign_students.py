@@ -1,12 +1,28 @@
 import csv
+import heapq
+import os
 import random
-import lp_maker as lpm
-import lpsolve55 as lps
+import sys
+import time
+import numpy as np
+import anytime
+import backends
+import cache
+import dedupe
+import feasibility
+import flow
+import lp_writer
+import metrics
+import rank_maximal
+import sparse_lp
 from argparse import ArgumentParser
+from array import array
 from collections import OrderedDict
 
 CSV_OUT = 'out.csv'
 LP_OUT = 'out.lp'
+METRICS_OUT = 'metrics.jsonl'
+UNASSIGNED_OUT = 'unassigned.csv'
 SECTION_CAP = 32 # currently set to 1 for assigning TAs, real cap is 32
 SECTS_PER_STUD = 1 # currently set to 2 for assigning TAs, use 2 for class
 SECTIONS_TUP = (('M 0330-0500 PM W 0400-0530 PM', (30, 31, 32)),
@@ -28,233 +44,844 @@ SECTIONS_TUP = (('M 0330-0500 PM W 0400-0530 PM', (30, 31, 32)),
 SECTIONS = OrderedDict(SECTIONS_TUP)
 CONCURR_SECTIONS = ()
 DEFAULT_RANK = 8
+RANK_EXPONENT = 3 # students' cost is (rank+1)**RANK_EXPONENT
+SECTION_CAPS = {} # per-section overrides of SECTION_CAP
+CHURN_PENALTY = 1000 # cost of moving a placed student in an incremental run
+IGNORE_UNKNOWN_TIMES = False # skip preferences for times not in SECTIONS
+OBJECTIVES = ('weighted',) + rank_maximal.MODES
 
-class Student:
-    priorities = []
+class Cohort:
+    """
+    Students in columnar form. rankings is an N x M matrix of small ints with
+    one row per student, and names, emails, sids, priorities and num_sections
+    are parallel per-student arrays. sections[j] is the tuple of student j's
+    assigned sections, all starting out as the one shared empty tuple, since
+    a set per student would outweigh the rest of the cohort.
+    """
 
-    def __init__(self, name, sid, email, rankings,
-                 num_sections=SECTS_PER_STUD, priority=0):
-        self.name = name
-        self.sid = sid
-        self.fix_email(email)
-        self.num_sections = num_sections
+    def __init__(self, names, emails, sids, rankings, priorities,
+                 num_sections, prefs=None):
+        self.names = names
+        self.emails = emails
+        self.sids = sids
         self.rankings = rankings
-        self.priority = priority
-        self.sections = set()
-        Student.priorities.append(priority)
-
-    @staticmethod
-    def display(students):
-        for student in students:
-            print student
-
-    def fix_email(self, email):
-        self.email = email
-        if email.endswith('@'):
-            self.email += 'berkeley.edu'
-        elif '@' not in email:
-            self.email += '@berkeley.edu'
+        self.priorities = priorities
+        self.num_sections = num_sections
+        self.prefs = prefs
+        self.sections = [()] * len(names)
 
-    def __repr__(self):
-        return 'Student({0}, {1})'.format(self.name, self.sid, self.email,
-                                          self.rankings)
+    def take(self, order):
+        """
+        Returns the cohort of the students at the indices in order.
+        """
+        order = np.asarray(order, dtype=np.intp)
+        prefs = None
+        if self.prefs is not None:
+            prefs = [self.prefs[j] for j in order]
+        cohort = Cohort([self.names[j] for j in order],
+                        [self.emails[j] for j in order], self.sids[order],
+                        self.rankings[order], self.priorities[order],
+                        self.num_sections[order], prefs)
+        cohort.sections = [self.sections[j] for j in order]
+        return cohort
 
-    def __str__(self):
-        return '{0}: {1}'.format(self.name, ', '.join((str(s) for s in
-                                                       self.sections)))
+    def display(self):
+        for name, sections in zip(self.names, self.sections):
+            print '{0}: {1}'.format(name, ', '.join((str(s) for s in
+                                                     sections)))
 
-    def __eq__(self, other):
-        if not isinstance(other, Student):
-            raise TypeError('can only compare with a Student')
-        return (other.email == self.email) + \
-               (other.name == self.name) + (other.sid == self.sid) > 1
+    def __len__(self):
+        return len(self.names)
 
-    def __hash__(self):
-        return hash(self.email)
+def fix_email(email):
+    if email.endswith('@'):
+        return email + 'berkeley.edu'
+    elif '@' not in email:
+        return email + '@berkeley.edu'
+    else:
+        return email
 
-def import_students(csv_file, prioritize=False, debug=False):
+def import_students(csv_file, prioritize=False, debug=False, seed=0):
     """
-    Returns a list of students with their specified rankings.
+    Returns a Cohort of the students with their specified rankings, parsed in
+    one streaming pass. Rows matching on two of email, name and sid are one
+    student's submissions, of which the latest by Timestamp is kept, see
+    dedupe. The cohort comes in an order shuffled by seed, so the same seed
+    gives the same run.
     """
-    students = set()
+    columns = dict((s, i) for i, s in enumerate(SECTIONS))
+    M = len(columns)
+    names, emails, prefs = [], [], []
+    sids, priorities = array('l'), array('i')
+    deduper = dedupe.Deduper()
     with open(csv_file, 'rU') as f:
         csvreader = csv.reader(f)
         num_s = len(csvreader.next()) - 4 # first line -- headers
+        typecode = 'b' if max(num_s, DEFAULT_RANK) < 128 else 'h'
+        rankings = array(typecode)
         for row in csvreader:
             name = row[1]
             sid = int(row[3])
-            email = row[2]
+            email = fix_email(row[2])
             if prioritize:
-                rankings = convert_to_rankings(row[4:-1])
+                pref_list = row[4:-1]
                 priority = int(row[-1])
-                stud = Student(name, sid, email, rankings, priority=priority)
-                if debug:
-                    stud.prefs = row[4:-1]
             else:
-                rankings = convert_to_rankings(row[4:])
-                stud = Student(name, sid, email, rankings)
+                pref_list = row[4:]
+                priority = 0
+            student_rankings = convert_to_rankings(pref_list, columns,
+                                                   typecode)
+            j, replace = deduper.add(email, sid, name, row[0],
+                                     csvreader.line_num)
+            if j == len(names):
+                names.append(name)
+                emails.append(email)
+                sids.append(sid)
+                priorities.append(priority)
+                rankings.extend(student_rankings)
+                if debug:
+                    prefs.append(pref_list)
+            elif replace:
+                names[j] = name
+                emails[j] = email
+                sids[j] = sid
+                priorities[j] = priority
+                rankings[j*M:(j+1)*M] = student_rankings
                 if debug:
-                    stud.prefs = row[4:]
-            students.discard(stud)
-            students.add(stud)
-    students = list(students)
-    random.shuffle(students)
-    return students
-
-def convert_to_rankings(pref_list):
-    rankings = [DEFAULT_RANK for _ in SECTIONS]
+                    prefs[j] = pref_list
+    deduper.report(debug)
+    N = len(names)
+    dtype = np.int8 if typecode == 'b' else np.int16
+    cohort = Cohort(names, emails, np.frombuffer(sids, dtype=np.int_).copy(),
+                    np.frombuffer(rankings, dtype=dtype).reshape(N, M).copy(),
+                    np.frombuffer(priorities, dtype=np.intc).copy(),
+                    np.repeat(SECTS_PER_STUD, N), prefs if debug else None)
+    order = range(N)
+    random.Random(seed).shuffle(order)
+    return cohort.take(order)
+
+def convert_to_rankings(pref_list, columns, typecode='b'):
+    """
+    Returns the rankings array for one row of preferences, using columns to
+    map a section time to its index.
+    """
+    rankings = array(typecode, [DEFAULT_RANK]) * len(columns)
     for rank, s in enumerate(pref_list):
-        index = SECTIONS.keys().index(s)
-        if rankings[index] == DEFAULT_RANK:
-            rankings[index] = rank
+        if not s:
+            continue # left blank
+        if s not in columns:
+            if IGNORE_UNKNOWN_TIMES:
+                continue
+            raise ValueError('unknown section time: {0}'.format(s))
+        if rankings[columns[s]] == DEFAULT_RANK:
+            rankings[columns[s]] = rank
     return rankings
 
-def parse_results(res, students, M, debug=False):
-    i = 0
-    sects_enroll = dict((s, SECTION_CAP) for sects in SECTIONS.values() for s in
-                        sects)
-    if debug:
-        bad_count = 0
-        ranks = []
-    for student in students:
-        for section in range(M):
-            if res[i] == 1:
-                possible_sects = filter(lambda s: sects_enroll[s] > 0,
-                                        SECTIONS[SECTIONS.keys()[section]])
-                random_sect = random.choice(possible_sects)
-                student.sections.add(random_sect)
-                sects_enroll[random_sect] -= 1
-                if debug:
-                    try:
-                        rank = student.prefs.index(SECTIONS.keys()[section])+1
-                    except ValueError:
-                        rank = DEFAULT_RANK + 1
-                        bad_count += 1
-                    print '{} ranked section {} as {}'.format(student.name,
-                                                              random_sect, rank)
-                    ranks.append(rank)
-            i += 1
+def parse_results(res, students, M, debug=False, seed=0, prior=None,
+                  seats=None):
+    """
+    Decodes the solver's variable vector into students.sections. Each time
+    slot's enrollees are dealt round-robin over its sections in a seeded
+    random order, so the sections of a slot come out evenly sized. With
+    prior, students first keep their previous section where it has room.
+    seats: optionally the number of pinned students in each section, who
+    count toward its size, see fill_sections.
+    """
+    chosen = np.asarray(res, dtype=float).reshape(-1, M) > 0.5
+    rows, cols = np.nonzero(chosen)
+    by_slot = np.argsort(cols, kind='mergesort')
+    bounds = np.searchsorted(cols[by_slot], np.arange(M+1))
+    sects = np.empty(len(rows), dtype=np.int64)
+    rand = np.random.RandomState(seed)
+    uniform = not SECTION_CAPS and prior is None and not seats
+    for i, slot_sects in enumerate(SECTIONS.values()):
+        members = rand.permutation(by_slot[bounds[i]:bounds[i+1]])
+        if uniform:
+            sects[members] = np.resize(slot_sects, len(members))
+        else:
+            previous = None if prior is None else prior[rows[members]]
+            sects[members] = fill_sections(slot_sects, len(members), previous,
+                                           seats)
+    for j, section in zip(rows.tolist(), sects.tolist()):
+        students.sections[j] += (section,)
     if debug:
-        print 'bad count: {}'.format(bad_count)
-        print 'min: {0}, max: {1}, mean: {2}'.format(min(ranks), max(ranks),
-                                                   sum(ranks)/float(len(ranks)))
+        ranks = students.rankings[rows, cols].astype(np.int64) + 1
+        for j, section, rank in zip(rows.tolist(), sects.tolist(),
+                                    ranks.tolist()):
+            print '{} ranked section {} as {}'.format(students.names[j],
+                                                      section, rank)
+        print 'bad count: {}'.format((ranks == DEFAULT_RANK + 1).sum())
+        print 'min: {0}, max: {1}, mean: {2}'.format(ranks.min(), ranks.max(),
+                                                   ranks.mean())
+
+def fill_sections(slot_sects, count, previous=None, seats=None):
+    """
+    Returns sections for count enrollees of a time slot. An enrollee keeps
+    its previous section if it is one of slot_sects with room left; the rest
+    go to the emptiest sections first, within each section's capacity.
+    seats: optionally the number of pinned students in each section. They
+    are not in the model, whose caps leave their seats out, but they count
+    toward a section's size when evening the sections out.
+    """
+    seats = seats or {}
+    caps = dict((s, SECTION_CAPS.get(s, SECTION_CAP) + seats.get(s, 0))
+                for s in slot_sects)
+    filled = dict((s, seats.get(s, 0)) for s in slot_sects)
+    result = np.empty(count, dtype=np.int64)
+    rest = []
+    for n in range(count):
+        s = -1 if previous is None else previous[n]
+        if s in filled and filled[s] < caps[s]:
+            result[n] = s
+            filled[s] += 1
+        else:
+            rest.append(n)
+    heap = [(filled[s], s) for s in slot_sects if filled[s] < caps[s]]
+    heapq.heapify(heap)
+    for n in rest:
+        if not heap:
+            raise ValueError('sections {0} are over capacity'.format(
+                slot_sects))
+        c, s = heapq.heappop(heap)
+        result[n] = s
+        if c + 1 < caps[s]:
+            heapq.heappush(heap, (c + 1, s))
+    return result
 
-def output_csvs(students):
+def output_csvs(students, directory='.', pinned=()):
+    """
+    Writes one csv of (name, email) rows per section. pinned holds the
+    (name, email, section) of students placed before the run, who are
+    merged into their sections by last name.
+    """
     from collections import defaultdict
     import csv
     sections = defaultdict(list)
-    for student in students:
-        sections[next(iter(student.sections))].append(student)
-    for section, students in sections.items():
-        with open(str(section) + '.csv', 'wb') as csvf:
+    for j in range(len(students)):
+        sections[next(iter(students.sections[j]))].append(
+            (students.names[j], students.emails[j]))
+    for name, email, section in pinned:
+        sections[section].append((name, email))
+    for section, rows in sections.items():
+        if pinned:
+            rows.sort(key=lambda row: row[0].lower().split()[-1])
+        path = os.path.join(directory, str(section) + '.csv')
+        with open(path, 'wb') as csvf:
             csvwriter = csv.writer(csvf)
-            for student in students:
-                csvwriter.writerow((student.name, student.email))
+            for row in rows:
+                csvwriter.writerow(row)
 
-def assign_sections(students, prioritize=False, debug=False):
+def assign_sections(students, prioritize=False, debug=False, aggregate=False,
+                    backend='auto', prior=None, penalty=CHURN_PENALTY,
+                    use_cache=True, lp_out=None, budget=None,
+                    objective='weighted', seats=None):
     """
-    students: a list of student objects
+    students: a Cohort
     i = index of sections
     j = index of students
     The columns, x_i_j, go as follows:
         x_0_0, x_1_0, x_2_0, ..., x_0_1, ..., x_M_N
+    With aggregate set, j indexes groups of students with identical
+    preference profiles instead, and x_i_j is the integer number of students
+    in group j placed in section i.
+    prior: for an incremental run, each student's previous section (-1 for
+    none). Moving a placed student to another time slot costs penalty, and
+    students who stay in their time slot keep their section.
+    With use_cache, a solution cached for the same inputs is decoded without
+    building or solving the model.
+    lp_out: optionally a path to export the model to, see lp_writer.
+    budget: for an anytime run, the seconds to spend, see solve_anytime.
+    objective: 'weighted' for the (rank+1)**RANK_EXPONENT costs, or one of
+    rank_maximal.MODES for an exact lexicographic assignment, solved by flow.
+    The exported and reported objective stays the weighted one.
+    seats: optionally the number of pinned students in each section, see
+    pin_students.
+    Returns the backends.Result of the solve, or of the cache hit.
+    """
+
+    M = students.rankings.shape[1] # number of section
+    if budget is not None and aggregate:
+        raise ValueError('anytime runs do not aggregate students')
+    if objective != 'weighted':
+        check_ranked(objective, prioritize, aggregate, backend, prior, budget)
+    if use_cache:
+        key = cache_key(students, prioritize, prior, penalty, objective)
+        hit = cache.load(key)
+        metrics.record('cache', hit=hit is not None)
+        if hit is not None:
+            res = np.empty_like(hit[0])
+            res[canonical_order(students)] = hit[0]
+            result = backends.Result('cache', hit[2], res, hit[1])
+            result.report()
+            with metrics.phase('decode'):
+                parse_results(res, students, M, debug, prior=prior,
+                              seats=seats)
+            return result
+    shortfall = check_feasible(students)
+    if shortfall is not None:
+        report_shortfall(shortfall, students)
+        raise ValueError('no feasible assignment, see above')
+    with metrics.phase('objective'):
+        f = make_obj_f(students, prioritize)
+        if prior is not None:
+            f = f + make_churn_f(prior_slots(prior), M, penalty)
+    if aggregate:
+        groups = group_students(students, f, M)
+        first = [group[0] for group in groups]
+        reps = students.take(first)
+        f = f.reshape(-1, M)[first].ravel()
+        sizes = [len(group) for group in groups]
+        v = [size for size in sizes for _ in range(M)]
+    else:
+        reps = students
+        sizes = None
+        v = [1 for _ in range(M*len(students))]
+    N = len(reps)                 # number of students (or groups)
+
+    network = None
+    if objective != 'weighted':
+        network = lambda: solve_ranked(students, M, objective)
+    elif is_network() and not aggregate and budget is None:
+        network = lambda: solve_flow(f, students, M)
+    model = backends.Model(f, lambda: (make_coeff_m(M, N),
+                                       make_b_v(reps, M, N, sizes),
+                                       make_e_v(M, N)),
+                           v, aggregate, network)
+    if lp_out:
+        lp_writer.write_model(lp_out, model)
+    if budget is None:
+        result = backends.solve(model, backend)
+    else:
+        result = solve_anytime(model, students, M, budget, backend)
+    res = result.x
+    cohort = students
+    if aggregate:
+        # decode in group order, then copy the sections back to the caller
+        order = [j for group in groups for j in group]
+        res = expand_results(res, groups, M)
+        students = students.take(order)
+        if prior is not None:
+            prior = prior[order]
+    if use_cache and result.status == backends.OPTIMAL:
+        res = np.asarray(res).reshape(-1, M)
+        cache.store(key, res[canonical_order(students)] > 0.5,
+                    result.objective, result.status)
+    if objective != 'weighted':
+        report_ranks(students, res, M, objective)
+    with metrics.phase('decode'):
+        parse_results(res, students, M, debug, prior=prior, seats=seats)
+    if aggregate:
+        for k, j in enumerate(order):
+            cohort.sections[j] = students.sections[k]
+    return result
+
+def solve_anytime(model, students, M, budget, backend='auto'):
+    """
+    Builds a greedy assignment and improves it by local search, then, if a
+    MIP solver is installed, runs it for the rest of budget seconds and
+    keeps the better of the two. Reports the optimality gap against the LP
+    relaxation, or against every student's cheapest slots without an LP
+    solver, and returns the best Result.
+    """
+    start = time.time()
+    N = len(students)
+    costs = np.asarray(model.f).reshape(N, M)
+    groups = CONCURR_SECTIONS if SECTS_PER_STUD > 1 else ()
+    with metrics.phase('anytime'):
+        x, optimal = anytime.solve(costs, slot_caps(), students.num_sections,
+                                   groups, budget)
+    status = backends.OPTIMAL if optimal else backends.SUBOPTIMAL
+    result = backends.Result('anytime', status,
+                             x.ravel().astype(int).tolist(),
+                             anytime.objective(costs, x))
+    result.solve_time = time.time() - start
+    result.report()
+    if backend == 'auto':
+        backend = backends.choose(model)
+    remaining = budget - (time.time() - start)
+    if not optimal and remaining > 0 and backend != 'flow' and \
+       backends.available(backend):
+        model.time_limit = remaining
+        try:
+            polished = backends.solve(model, backend)
+        except ValueError:
+            polished = None
+        if polished is not None and polished.objective <= result.objective:
+            result = polished
+    bound = None
+    if result.status != backends.OPTIMAL and backend != 'flow' and \
+       backends.available(backend):
+        bound = backends.relaxation_bound(model)
+    if result.status == backends.OPTIMAL:
+        bound = result.objective
+    elif bound is None:
+        bound = anytime.lower_bound(costs, students.num_sections)
+    gap = (result.objective - bound) / float(max(abs(result.objective), 1))
+    sys.stderr.write('anytime: objective {0}, bound {1:.1f}, gap {2:.2%}\n'
+                     .format(result.objective, bound, max(gap, 0)))
+    backends.record(model, result)
+    metrics.record('solver', bound=bound, gap=max(gap, 0))
+    return result
+
+def canonical_order(students):
+    """
+    Returns the student indices in an order that does not depend on the
+    export's row order or the shuffle.
+    """
+    return sorted(range(len(students)),
+                  key=lambda j: (students.emails[j], students.names[j],
+                                 students.sids[j]))
+
+def cache_key(students, prioritize, prior, penalty, objective='weighted'):
+    """
+    Returns the cache key of a run: its model data in canonical order plus
+    every setting the model depends on.
+    """
+    order = canonical_order(students)
+    arrays = [students.rankings[order], students.priorities[order],
+              students.num_sections[order]]
+    config = (SECTIONS.items(), SECTION_CAP, sorted(SECTION_CAPS.items()),
+              SECTS_PER_STUD, CONCURR_SECTIONS, DEFAULT_RANK, prioritize,
+              RANK_EXPONENT, objective)
+    if prior is not None:
+        arrays.append(prior[order])
+        config += (penalty,)
+    return cache.model_key(arrays, config)
+
+def prior_slots(prior):
+    """
+    Maps each student's previous section to its time slot index, or -1 when
+    the student had none or the section has closed.
+    """
+    slot_of = dict((s, i) for i, sects in enumerate(SECTIONS.values())
+                   for s in sects)
+    return np.array([slot_of.get(s, -1) for s in prior.tolist()])
+
+def make_churn_f(slots, M, penalty):
+    """
+    Returns the churn costs: penalty on every time slot but a placed
+    student's previous one.
+    """
+    placed = np.nonzero(slots >= 0)[0]
+    churn = np.zeros((len(slots), M), dtype=np.int64)
+    churn[placed] = penalty
+    churn[placed, slots[placed]] = 0
+    return churn.ravel()
+
+def slot_caps():
+    """
+    Returns the capacity of each time slot, the sum of its sections' caps.
+    """
+    return np.array([sum(SECTION_CAPS.get(s, SECTION_CAP) for s in sects)
+                     for sects in SECTIONS.values()], dtype=np.int64)
+
+def is_network():
+    """
+    Without concurrency rows the model is a transportation problem, which
+    flow.min_cost_assignment solves exactly without branch and bound.
+    """
+    return SECTS_PER_STUD == 1 or not CONCURR_SECTIONS
+
+def solve_flow(f, students, M):
+    """
+    Solves the model as a min-cost flow and returns the 0/1 variable vector.
     """
+    N = len(students)
+    costs = f.reshape(N, M).tolist()
+    assignment, _ = flow.min_cost_assignment(costs, slot_caps().tolist(),
+                                             students.num_sections.tolist())
+    return assignment_vector(assignment, M)
 
-    M = len(students[0].rankings) # number of section
-    N = len(students)             # number of students
+def solve_ranked(students, M, objective):
+    """
+    Solves for the rank-maximal or minimax assignment, see rank_maximal, and
+    returns the 0/1 variable vector.
+    """
+    assignment = rank_maximal.solve(students.rankings, slot_caps().tolist(),
+                                    students.num_sections.tolist(), objective)
+    return assignment_vector(assignment, M)
+
+def check_feasible(students):
+    """
+    Returns None if every student can get num_sections time slots, else the
+    feasibility.Shortfall, without building the model.
+    """
+    groups = CONCURR_SECTIONS if SECTS_PER_STUD > 1 else ()
+    with metrics.phase('feasibility'):
+        return feasibility.check(students.num_sections.tolist(),
+                                 slot_caps().tolist(), groups)
+
+def report_shortfall(shortfall, students):
+    shortfall.report(students.names, [
+        '{0} {1}'.format(slot, sects) for slot, sects in SECTIONS.items()],
+        'students', 'time slots', slot_caps().tolist())
+
+def relax(students, prioritize=False, seed=0):
+    """
+    Lowers the num_sections of the students who do not fit to what does.
+    Only the shortfall's Hall violator, the students competing for the
+    oversubscribed time slots, lose out. Each group of them with the same
+    num_sections keeps the placements the max flow found for it, and those
+    go to the students whose next slot costs least, ties broken by a
+    RandomState(seed). So the students left out are those who ranked the
+    full slots lowest or, with prioritize, have the least priority.
+    Returns the students still to place and those left with no section.
+    """
+    shortfall = check_feasible(students)
+    if shortfall is None:
+        return students, students.take([])
+    report_shortfall(shortfall, students)
+    placed = np.array(shortfall.placed, dtype=students.num_sections.dtype)
+    rows = np.array(shortfall.rows, dtype=np.intp)
+    M = students.rankings.shape[1]
+    costs = np.sort(make_obj_f(students.take(rows), prioritize)
+                    .reshape(-1, M), axis=1)
+    tiebreak = np.random.RandomState(seed).permutation(len(rows))
+    demands = students.num_sections[rows]
+    for d in np.unique(demands).tolist():
+        group = np.nonzero(demands == d)[0]
+        base, extra = divmod(int(placed[rows[group]].sum()), len(group))
+        # the cost of the slot each would get with one more placement
+        marginal = costs[group, min(base, M - 1)]
+        keep = group[np.lexsort((tiebreak[group], marginal))]
+        placed[rows[group]] = base
+        placed[rows[keep[:extra]]] += 1
+    fewer = ((placed > 0) & (placed < students.num_sections)).sum()
+    students.num_sections = placed
+    unassigned = students.take(np.nonzero(placed == 0)[0])
+    sys.stderr.write('relaxed: {0} students unassigned, {1} get fewer '
+                     'sections\n'.format(len(unassigned), fewer))
+    return students.take(np.nonzero(placed)[0]), unassigned
+
+def output_unassigned(students, directory='.'):
+    with open(os.path.join(directory, UNASSIGNED_OUT), 'wb') as csvf:
+        csvwriter = csv.writer(csvf)
+        for j in range(len(students)):
+            csvwriter.writerow((students.names[j], students.emails[j]))
+
+def assignment_vector(assignment, M):
+    res = [0 for _ in range(M*len(assignment))]
+    for j, sections in enumerate(assignment):
+        for i in sections:
+            res[j*M+i] = 1
+    return res
+
+def check_ranked(objective, prioritize, aggregate, backend, prior, budget):
+    """
+    Raises ValueError unless a run with a lexicographic objective can be
+    solved as one.
+    """
+    if objective not in rank_maximal.MODES:
+        raise ValueError('unknown objective: {0}'.format(objective))
+    if prioritize or aggregate or prior is not None or budget is not None:
+        raise ValueError('the {0} objective takes no priorities, aggregation, '
+                         'previous assignment or budget'.format(objective))
+    if backend not in ('auto', 'flow'):
+        raise ValueError('the {0} objective is solved by the flow '
+                         'backend'.format(objective))
+    if not is_network():
+        raise ValueError('the {0} objective needs a model without concurrent '
+                         'sections'.format(objective))
 
-    f = make_obj_f(students, prioritize)
-    A = make_coeff_m(M, N)
-    b = make_b_v(students, M, N)
-    e = make_e_v(M, N)
-    v = [1 for _ in range(M*N)]
+def report_ranks(students, res, M, objective, out=sys.stderr):
+    """
+    Reports how many placements went to each rank.
+    """
+    chosen = np.asarray(res, dtype=float).reshape(-1, M) > 0.5
+    counts = np.bincount(students.rankings[chosen].astype(np.int64),
+                         minlength=DEFAULT_RANK + 1)
+    labels = [str(r + 1) if r != DEFAULT_RANK else 'unranked'
+              for r in range(len(counts))]
+    out.write('{0}: {1}\n'.format(objective, ', '.join(
+        '{0}: {1}'.format(label, n) for label, n in zip(labels, counts)
+        if n)))
+    metrics.record('ranks', **dict(zip(labels, counts.tolist())))
 
-    lp = lpm.lp_maker(f, A, b, e, None, v)
+def group_students(students, f, M):
+    """
+    Groups students with identical objective coefficients and num_sections,
+    which are interchangeable in the model. The coefficients cover rankings,
+    priority and churn alike. Returns a list of lists of student indices.
+    """
+    costs = f.reshape(-1, M)
+    groups = OrderedDict()
+    for j in range(len(students)):
+        key = (costs[j].tobytes(), students.num_sections[j])
+        groups.setdefault(key, []).append(j)
+    return groups.values()
 
-    # set branch and bound depth to be unlimited
-    lps.lpsolve('set_bb_depthlimit', lp, 0)
-    # set all variables to binary
-    lps.lpsolve('set_binary', lp, v)
-    # set lp to minimize the objective function
-    lps.lpsolve('set_minim', lp)
+def slot_order(M):
+    """
+    Returns the section indices with each concurrent group kept contiguous.
+    """
+    order = [s for concurr_s in CONCURR_SECTIONS for s in concurr_s]
+    if len(set(order)) != len(order):
+        raise ValueError('aggregation needs disjoint concurrent sections')
+    seen = set(order)
+    return order + [s for s in range(M) if s not in seen]
 
-    lps.lpsolve('write_lp', lp, LP_OUT)
-    lps.lpsolve('solve', lp)
-    res = lps.lpsolve('get_variables', lp)[0]
-    lps.lpsolve('delete_lp', lp)
-    parse_results(res, students, M, debug)
+def expand_results(res, groups, M):
+    """
+    Expands the per-group section counts of an aggregated solve into one 0/1
+    entry per student and section, in the order of the grouped students.
+    Section seats are dealt round-robin, so since no count exceeds the group
+    size, no student gets the same (or two concurrent) sections twice.
+    """
+    order = slot_order(M)
+    expanded = []
+    for g, group in enumerate(groups):
+        rows = [[0 for _ in range(M)] for _ in group]
+        k = 0
+        for section in order:
+            for _ in range(int(round(res[g*M+section]))):
+                rows[k % len(group)][section] = 1
+                k += 1
+        for row in rows:
+            expanded.extend(row)
+    return expanded
 
 def make_obj_f(students, prioritize):
-    coeffs = []
-    for student in students:
-        if prioritize:
-            s_rankings = [(r+1) * (max(Student.priorities)-student.priority+1)
-                          for r in student.rankings]
-        else:
-            s_rankings = [(r+1)**3 for r in student.rankings]
-        coeffs.extend(s_rankings)
-    return coeffs
+    """
+    Returns the objective coefficients as one array expression over the
+    ranking matrix, with x_i_j's coefficient at index j*M+i.
+    """
+    ranks = students.rankings.astype(np.int64) + 1
+    if prioritize:
+        weights = students.priorities.max() - students.priorities + 1
+        return (ranks * weights[:, np.newaxis]).ravel()
+    return (ranks**RANK_EXPONENT).ravel()
 
 def make_coeff_m(M, N):
-    m = []
+    m = sparse_lp.SparseMatrix(M*N)
     # COEFFICIENTS FOR CONSTRAINTS ON SECTION CAPS
     for x in range(M):
-        tmp_zeroes = [0 for _ in range(M*N)]
-        for y in range(x, M*N, M):
-            tmp_zeroes[y] = 1
-        m.append(tmp_zeroes)
+        m.add_row(range(x, M*N, M))
     # COEFFICIENTS FOR CONSTRAINTS ON NUMBER OF SECTIONS PER STUDENT
     for x in range(N):
-        tmp_zeroes = [0 for _ in range(M*N)]
-        for y in range(x*M, (x+1)*M):
-            tmp_zeroes[y] = 1
-        m.append(tmp_zeroes)
+        m.add_row(range(x*M, (x+1)*M))
     # COEFFICIENTS TO PREVENT CONCURRENT SECTION ASSIGNMENT
     if SECTS_PER_STUD > 1:
         for x in range(N):
             for concurr_s in CONCURR_SECTIONS:
-                tmp_zeroes = [0 for _ in range(M*N)]
-                for s in concurr_s:
-                    tmp_zeroes[x*M+s] = 1
-                m.append(tmp_zeroes)
+                m.add_row(x*M+s for s in concurr_s)
     return m
 
-def make_b_v(students, M, N):
-    v = [len(s) * SECTION_CAP for s in SECTIONS.values()] + \
-        [student.num_sections for student in students]
+def make_b_v(students, M, N, sizes=None):
+    sizes = np.ones(N, dtype=np.int64) if sizes is None else np.asarray(sizes)
+    v = [slot_caps(), students.num_sections * sizes]
     if SECTS_PER_STUD > 1:
-        v += [1 for _ in range(len(CONCURR_SECTIONS) * N)]
-    return v
+        v.append(np.repeat(sizes, len(CONCURR_SECTIONS)))
+    return np.concatenate(v)
 
 def make_e_v(M, N):
-    v = [-1 for _ in range(M)] + [0 for _ in range(N)]
+    v = [np.repeat(-1, M), np.zeros(N, dtype=np.int64)]
     if SECTS_PER_STUD > 1:
-        v += [-1 for _ in range(len(CONCURR_SECTIONS) * N)]
-    return v
+        v.append(np.repeat(-1, len(CONCURR_SECTIONS) * N))
+    return np.concatenate(v)
+
+def load_assignment(directory):
+    """
+    Reads the per-section CSVs that output_csvs wrote to directory and
+    returns a dict from email to section.
+    """
+    assignment = {}
+    for fn in os.listdir(directory):
+        section, ext = os.path.splitext(fn)
+        if ext == '.csv' and section.isdigit():
+            with open(os.path.join(directory, fn), 'rU') as f:
+                for row in csv.reader(f):
+                    assignment[fix_email(row[1])] = int(section)
+    return assignment
+
+def load_emails(path):
+    """
+    Returns the set of emails in the first column of the csv at path.
+    """
+    with open(path, 'rU') as f:
+        return set(fix_email(row[0].strip()) for row in csv.reader(f)
+                   if row and row[0].strip())
+
+def load_pins(path):
+    """
+    Reads a csv of already placed students, with rows of (email, section)
+    or (name, email, section), and returns a dict from email to
+    (name, section). The name is None when the row has none.
+    """
+    pins = {}
+    with open(path, 'rU') as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            name = row[0] if len(row) > 2 else None
+            pins[fix_email(row[-2].strip())] = (name, int(row[-1]))
+    return pins
+
+def filter_students(students, include=None, exclude=None):
+    """
+    Returns the students whose email is in include (all by default) and not
+    in exclude.
+    """
+    keep = [j for j, email in enumerate(students.emails)
+            if (include is None or email in include) and
+            not (exclude and email in exclude)]
+    if len(keep) == len(students):
+        return students
+    return students.take(keep)
+
+def pin_students(students, pins):
+    """
+    Takes the pinned students out of the model: their seats come off their
+    sections' capacity in SECTION_CAPS. Returns the free students, the
+    (name, email, section) of every pin and the number of pins in each
+    section.
+    """
+    catalog = set(s for sects in SECTIONS.values() for s in sects)
+    taken = {}
+    for _, section in pins.values():
+        if section not in catalog:
+            raise ValueError('pinned to unknown section {0}'.format(section))
+        taken[section] = taken.get(section, 0) + 1
+    for section, count in taken.items():
+        cap = SECTION_CAPS.get(section, SECTION_CAP) - count
+        if cap < 0:
+            raise ValueError('section {0} has {1} more pins than seats'
+                             .format(section, -cap))
+        SECTION_CAPS[section] = cap
+    names = dict(zip(students.emails, students.names))
+    pinned = [(name or names.get(email, email), email, section)
+              for email, (name, section) in sorted(pins.items())]
+    return filter_students(students, exclude=pins), pinned, taken
+
+def close_sections(closed):
+    """
+    Removes the closed section numbers from SECTIONS.
+    """
+    closed = set(closed)
+    for slot, sects in SECTIONS.items():
+        SECTIONS[slot] = tuple(s for s in sects if s not in closed)
+
+def report_churn(students, previous, imported):
+    """
+    Reports how an incremental run changed the previous assignment, by
+    distinct email. Only the students of previous missing from imported,
+    the emails of the whole export, count as dropped, not those pinned or
+    filtered out of the run.
+    """
+    kept = moved = added = 0
+    seen = set()
+    for email, sections in zip(students.emails, students.sections):
+        if email in seen:
+            continue
+        seen.add(email)
+        if email not in previous:
+            added += 1
+        elif previous[email] in sections:
+            kept += 1
+        else:
+            moved += 1
+    dropped = sum(1 for email in previous if email not in imported)
+    sys.stderr.write('incremental: {0} kept, {1} moved, {2} added, {3} '
+                     'dropped\n'.format(kept, moved, added, dropped))
 
 def debug_top(students):
     from collections import defaultdict
     print 'top 2 choices'
     sections = defaultdict(lambda: 0)
-    for student in students:
-        sections[student.prefs[0]] += 1
-        sections[student.prefs[1]] += 1
+    for prefs in students.prefs:
+        sections[prefs[0]] += 1
+        sections[prefs[1]] += 1
     for k, v in sections.items():
         print k, v
 
-def main(csv_file, prioritize, debug):
-    students = import_students(csv_file, prioritize, debug)
-    assign_sections(students, prioritize, debug)
-    students.sort(key=lambda s: s.name.lower().split()[-1])
-    if debug:
-        debug_top(students)
-        Student.display(students)
-    output_csvs(students)
+def main(csv_file, prioritize, debug, aggregate, backend, previous=None,
+         closed=(), caps=None, penalty=CHURN_PENALTY, use_cache=True,
+         invalidate=False, lp_out=None, out_dir='.', budget=None,
+         include=None, exclude=None, pins=None, objective='weighted',
+         relax_demands=False, seed=0):
+    global SECTIONS, SECTION_CAPS
+    if invalidate:
+        cache.invalidate()
+    saved = SECTIONS, SECTION_CAPS
+    # closures, cap changes and pins apply to copies, so the module's
+    # catalog is the same after the run and the next run starts afresh
+    SECTIONS = OrderedDict(SECTIONS)
+    SECTION_CAPS = dict(SECTION_CAPS)
+    try:
+        close_sections(closed)
+        SECTION_CAPS.update(caps or {})
+        with metrics.phase('import'):
+            students = import_students(csv_file, prioritize, debug, seed)
+        imported = set(students.emails) if previous else None
+        students = filter_students(students, include, exclude)
+        pinned, seats = (), None
+        if pins:
+            students, pinned, seats = pin_students(students, pins)
+        metrics.record('cohort', students=len(students), pinned=len(pinned),
+                       slots=students.rankings.shape[1])
+        unassigned = None
+        if relax_demands:
+            students, unassigned = relax(students, prioritize, seed)
+        prior = None
+        if previous:
+            assignment = load_assignment(previous)
+            prior = np.array([assignment.get(email, -1)
+                              for email in students.emails])
+        if len(students):
+            assign_sections(students, prioritize, debug, aggregate, backend,
+                            prior, penalty, use_cache, lp_out, budget,
+                            objective, seats)
+        if previous:
+            report_churn(students, assignment, imported)
+        order = sorted(range(len(students)),
+                       key=lambda j: students.names[j].lower().split()[-1])
+        students = students.take(order)
+        if debug:
+            debug_top(students)
+            students.display()
+        with metrics.phase('output'):
+            output_csvs(students, out_dir, pinned)
+            if unassigned is not None and len(unassigned):
+                output_unassigned(unassigned, out_dir)
+    finally:
+        SECTIONS, SECTION_CAPS = saved
 
 if __name__ == '__main__':
     parser = ArgumentParser(description='creates optimal section assignment')
     parser.add_argument('-p', '--prioritize', action='store_true', help='give students with seniority priority')
     parser.add_argument('-a', '--debug', action='store_true', help='debug results')
+    parser.add_argument('-g', '--aggregate', action='store_true', help='solve one variable per group of identical preferences (MIP backends only)')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend, picked by model size by default')
+    parser.add_argument('--previous', metavar='DIR', help='re-solve incrementally against the section csvs of an earlier run in DIR')
+    parser.add_argument('--close', type=int, nargs='+', default=[], metavar='SECTION', help='sections to close')
+    parser.add_argument('--cap', action='append', default=[], metavar='SECTION=CAP', help='change the capacity of a section')
+    parser.add_argument('--penalty', type=int, default=CHURN_PENALTY, help='cost of moving a previously placed student')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='always build and solve the model')
+    parser.add_argument('--invalidate-cache', action='store_true', help='drop all cached solutions first')
+    parser.add_argument('--write-lp', nargs='?', const=LP_OUT, metavar='PATH', help='export the model as .lp or .mps, optionally .gz (default: %(const)s)')
+    parser.add_argument('-t', '--budget', type=float, metavar='SECONDS', help='anytime mode: greedy plus local search, then a MIP solver if installed, within SECONDS, reporting the optimality gap')
+    parser.add_argument('--objective', default='weighted', choices=OBJECTIVES, help='weighted (rank+1)**RANK_EXPONENT costs, or an exact rank-maximal or minimax (best worst rank first) assignment')
+    parser.add_argument('--include', metavar='FILE', help='only place the students whose email is listed in FILE')
+    parser.add_argument('--exclude', metavar='FILE', help='leave out the students whose email is listed in FILE')
+    parser.add_argument('--pinned', metavar='FILE', help='csv of (email, section) or (name, email, section) rows of students already placed; they keep their seats and are not re-solved')
+    parser.add_argument('--relax', action='store_true', help='if not everyone fits, leave the students who do not unassigned (listed in %s) instead of failing' % UNASSIGNED_OUT)
+    parser.add_argument('--seed', type=int, default=0, help='seed of the order students are considered in, which breaks ties between equally good assignments')
+    parser.add_argument('--metrics', nargs='?', const=METRICS_OUT, metavar='PATH', help="append the run's timings, model size and solver statistics as a JSON line to PATH, - for stdout (default: %(const)s)")
+    parser.add_argument('--profile', metavar='PATH', help='run under cProfile and dump the stats to PATH')
+    parser.add_argument('--trace-memory', action='store_true', help='add the top allocation sites to the metrics (Python 3 only)')
     parser.add_argument('csv_file', help='csv file with section rankings')
     args = parser.parse_args()
-    main(args.csv_file, args.prioritize, args.debug)
+    caps = dict(map(int, c.split('=')) for c in args.cap)
+    if args.metrics or args.profile or args.trace_memory:
+        metrics.start(args.profile, args.trace_memory)
+    try:
+        main(args.csv_file, args.prioritize, args.debug, args.aggregate,
+             args.backend, args.previous, args.close, caps, args.penalty,
+             args.use_cache, args.invalidate_cache, args.write_lp,
+             budget=args.budget,
+             include=args.include and load_emails(args.include),
+             exclude=args.exclude and load_emails(args.exclude),
+             pins=args.pinned and load_pins(args.pinned),
+             objective=args.objective, relax_demands=args.relax,
+             seed=args.seed)
+    finally:
+        metrics.emit(args.metrics)
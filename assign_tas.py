@@ -1,22 +1,35 @@
 import csv
-import lp_maker as lpm
-import lpsolve55 as lps
+import heapq
+import numpy as np
+import backends
+import cache
+import dedupe
+import feasibility
+import flow
+import lp_writer
+import meeting_times
+import sparse_lp
 from argparse import ArgumentParser
+from assign_students import SECTIONS_TUP, fix_email
 
 CSV_OUT = 'out.csv'
 LP_OUT = 'out.lp'
 SECTION_CAP = 1 # currently set to 1 for assigning TAs, real cap is 32
 SECTS_PER_TA = 2 # currently set to 2 for assigning TAs, use 2 for class
 SECTIONS = tuple(i for i in range(11, 44))
-CONCURR_SECTIONS = ((11, 12, 13), (14, 15, 16), (17, 18, 19), (20, 21),
-                    (22, 23), (24, 25), (26, 27, 28), (30, 31, 32),
-                    (33, 34, 35), (36, 37, 38), (39, 40, 41), (29, 43))
+# meeting times of the sections, from the student catalog
+SECTION_TIMES = dict((s, slot) for slot, sects in SECTIONS_TUP for s in sects
+                     if s in SECTIONS)
+SECTION_INDEX = meeting_times.IntervalIndex(SECTION_TIMES)
+# disjoint groups of sections that meet at the same time
 CONCURR_SECTIONS = tuple(tuple(map(lambda s: SECTIONS.index(s), t))
-                         for t in CONCURR_SECTIONS)
+                         for t in SECTION_INDEX.groups())
+# pairs of sections of different groups that still overlap
+CONFLICTS = tuple(tuple(map(lambda s: SECTIONS.index(s), p))
+                  for p in SECTION_INDEX.pairs())
 DEFAULT_RANK = 10
 
 class TA:
-    priorities = []
 
     def __init__(self, name, sid, email, rankings,
                  num_sections=SECTS_PER_TA, priority=0):
@@ -27,7 +40,6 @@ class TA:
         self.rankings = rankings
         self.priority = priority
         self.sections = set()
-        TA.priorities.append(priority)
 
     @staticmethod
     def display(tas):
@@ -53,33 +65,39 @@ class TA:
 
 def import_tas(csv_file, prioritize=False, analyze=False):
     """
-    Returns a list of tas with their specified rankings.
+    Returns a list of tas with their specified rankings. Of the rows
+    matching on two of email, name and sid, the latest by Timestamp is kept,
+    see dedupe.
     """
-    tas = set()
+    tas = []
+    deduper = dedupe.Deduper()
     with open(csv_file, 'rU') as f:
         csvreader = csv.reader(f)
         num_s = len(csvreader.next()) - 3 # ignore first line -- headers
         for row in csvreader:
             name = row[1]
             sid = int(row[3])
-            email = row[2]
+            email = fix_email(row[2])
             if prioritize:
                 rankings = convert_to_rankings(row[4:-2])
                 num_sections = int(row[-2])
                 priority = int(row[-1])
                 ta = TA(name, sid, email, rankings, num_sections, priority)
-                tas.discard(ta)
-                tas.add(ta)
                 if analyze:
-                    ta.prefs = [int(s.split()[0]) for s in row[4:-2]]
+                    ta.prefs = [int(s.split()[0]) for s in row[4:-2] if s]
             else:
                 rankings = convert_to_rankings(row[4:-1])
                 num_sections = int(row[-1])
                 ta = TA(name, sid, email, rankings, num_sections)
-                tas.discard(ta)
-                tas.add(ta)
                 if analyze:
-                    ta.prefs = [int(s.split()[0]) for s in row[4:-1]]
+                    ta.prefs = [int(s.split()[0]) for s in row[4:-1] if s]
+            j, replace = deduper.add(email, sid, name, row[0],
+                                     csvreader.line_num)
+            if j == len(tas):
+                tas.append(ta)
+            elif replace:
+                tas[j] = ta
+    deduper.report(analyze)
     return sorted(tas, key=lambda s: s.name.split()[-1])
 
 def convert_to_rankings(pref_list):
@@ -89,6 +107,8 @@ def convert_to_rankings(pref_list):
     """
     rankings = [DEFAULT_RANK for _ in SECTIONS]
     for i, s in enumerate(pref_list):
+        if not s:
+            continue # left blank
         section = int(s.split()[0])
         rankings[SECTIONS.index(section)] = i
     return rankings
@@ -104,7 +124,7 @@ def parse_results(res, tas, M, analyze=False):
         if analyze:
             ta_ranks = []
         for section in range(M):
-            if res[i] == 1:
+            if res[i] > 0.5:
                 chosen_sect = SECTIONS[section]
                 ta.sections.add(chosen_sect)
                 if analyze:
@@ -122,101 +142,253 @@ def parse_results(res, tas, M, analyze=False):
         print 'min: {0}, max: {1}, mean: {2}'.format(min(ranks), max(ranks),
                                                      sum(ranks)/float(len(ranks)))
 
-def assign_sections(tas, prioritize=False, analyze=False):
+def assign_sections(tas, prioritize=False, analyze=False, backend='auto',
+                    lp_out=None, use_cache=True):
     """
     tas: a list of ta objects
     i = index of sections
     j = index of tas
     The columns, x_i_j, go as follows:
         x_0_0, x_1_0, x_2_0, ..., x_0_1, ..., x_M_N
+    With use_cache, a solution cached for the same inputs is decoded without
+    building or solving the model, see cache.
     """
 
     M = len(tas[0].rankings) # number of section
     N = len(tas)             # number of tas
+    if use_cache:
+        key = cache_key(tas, prioritize)
+        order = canonical_order(tas)
+        hit = cache.load(key)
+        if hit is not None:
+            res = np.empty_like(hit[0])
+            res[order] = hit[0]
+            backends.Result('cache', hit[2], res, hit[1]).report()
+            parse_results(res.ravel(), tas, M, analyze)
+            return
+    shortfall = check_feasible(tas)
+    if shortfall is not None:
+        report_shortfall(shortfall, tas)
+        raise ValueError('no feasible assignment, see above')
 
     f = make_obj_f(tas, prioritize)
-    A = make_coeff_m(M, N)
-    b = make_b_v(tas, M, N)
-    e = make_e_v(M, N)
-    v = [1 for _ in range(M*N)]
-
-    lp = lpm.lp_maker(f, A, b, e, None, v)
-
-    # set branch and bound depth
-    lps.lpsolve('set_bb_depthlimit', lp, 0)
-    # set all variables to binary
-    lps.lpsolve('set_binary', lp, v)
-    # set lp to minimize the objective function
-    lps.lpsolve('set_minim', lp)
-
-    lps.lpsolve('write_lp', lp, LP_OUT)
-    lps.lpsolve('solve', lp)
-    res = lps.lpsolve('get_variables', lp)[0]
-    lps.lpsolve('delete_lp', lp)
+    network = None
+    if is_network():
+        network = lambda: solve_flow(f, tas, M)
+    model = backends.Model(f, lambda: (make_coeff_m(M, N),
+                                       make_b_v(tas, M, N),
+                                       make_e_v(M, N)),
+                           [1 for _ in range(M*N)], network=network)
+    if lp_out:
+        lp_writer.write_model(lp_out, model)
+    result = backends.solve(model, backend)
+    res = result.x
+    if use_cache and result.status == backends.OPTIMAL:
+        res = np.asarray(res).reshape(N, M)
+        cache.store(key, res[order] > 0.5, result.objective, result.status)
+        res = res.ravel()
     parse_results(res, tas, M, analyze)
 
+def check_feasible(tas):
+    """
+    Returns None if every TA can get num_sections sections, else the
+    feasibility.Shortfall, without building the model. CONFLICTS are left
+    out, so this is a necessary condition only, see feasibility.
+    """
+    groups = CONCURR_SECTIONS if SECTS_PER_TA > 1 else ()
+    return feasibility.check([ta.num_sections for ta in tas],
+                             [SECTION_CAP for _ in SECTIONS], groups)
+
+def report_shortfall(shortfall, tas):
+    shortfall.report([ta.name for ta in tas], SECTIONS, 'TAs', 'sections',
+                     [SECTION_CAP for _ in SECTIONS])
+
+def relax(tas):
+    """
+    Lowers the num_sections of the TAs who do not fit to what does, and
+    drops the TAs left with none.
+    """
+    shortfall = check_feasible(tas)
+    if shortfall is None:
+        return tas
+    report_shortfall(shortfall, tas)
+    for ta, placed in zip(tas, shortfall.placed):
+        if placed < ta.num_sections:
+            print 'relaxed: {0} teaches {1} instead of {2} sections'.format(
+                ta.name, placed, ta.num_sections)
+            ta.num_sections = placed
+    return [ta for ta in tas if ta.num_sections]
+
+def canonical_order(tas):
+    """
+    Returns the TA indices in an order that does not depend on the export's
+    row order.
+    """
+    return sorted(range(len(tas)),
+                  key=lambda j: (tas[j].email, tas[j].name, tas[j].sid))
+
+def cache_key(tas, prioritize):
+    """
+    Returns the cache key of a run: its model data in canonical order plus
+    every setting the model depends on.
+    """
+    order = canonical_order(tas)
+    arrays = [np.array([tas[j].rankings for j in order], dtype=np.int64),
+              np.array([tas[j].num_sections for j in order], dtype=np.int64),
+              np.array([tas[j].priority for j in order], dtype=np.int64)]
+    config = ('tas', SECTIONS, SECTION_CAP, SECTS_PER_TA, CONCURR_SECTIONS,
+              CONFLICTS, DEFAULT_RANK, prioritize)
+    return cache.model_key(arrays, config)
+
+def is_network():
+    """
+    Disjoint concurrent groups can be modeled exactly by per-TA gadget nodes,
+    so the model is solved by min-cost flows, with CONFLICTS branched on,
+    see solve_flow.
+    """
+    grouped = [s for concurr_s in CONCURR_SECTIONS for s in concurr_s]
+    return SECTS_PER_TA == 1 or len(grouped) == len(set(grouped))
+
+def solve_flow(f, tas, M):
+    """
+    Solves the model as min-cost flows and returns the 0/1 variable vector.
+    Each flow enforces the concurrent groups, see flow_relaxation, and
+    CONFLICTS by branch and bound: a flow that gives a TA both sections of a
+    conflicting pair is split into a branch where the TA may not take the
+    first and one where the TA may not take the second. Every flow is a
+    relaxation of its branch, so the cheapest flow without a conflict is
+    optimal.
+    """
+    costs = f.tolist()
+    pairs = CONFLICTS if SECTS_PER_TA > 1 else ()
+    root = flow_relaxation(costs, tas, M, frozenset())
+    if root is None:
+        raise ValueError('no feasible assignment: the TAs cannot all get '
+                         'their number of sections')
+    # (objective, tiebreak, forbidden (TA, section) pairs, variable vector)
+    heap = [(root[1], 0, frozenset(), root[0])]
+    branches = 1
+    while heap:
+        _, _, forbidden, x = heapq.heappop(heap)
+        conflict = find_conflict(x, len(tas), M, pairs)
+        if conflict is None:
+            return x
+        j, pair = conflict
+        for i in pair:
+            branch = forbidden | set([(j, i)])
+            relaxed = flow_relaxation(costs, tas, M, branch)
+            if relaxed is not None:
+                heapq.heappush(heap, (relaxed[1], branches, branch,
+                                      relaxed[0]))
+                branches += 1
+    raise ValueError('no feasible assignment: every staffing gives a TA '
+                     'two concurrent sections')
+
+def find_conflict(x, N, M, pairs):
+    """
+    Returns the first (TA, pair) of pairs that the TA holds both sections
+    of in x, or None.
+    """
+    for j in range(N):
+        for a, b in pairs:
+            if x[j*M+a] and x[j*M+b]:
+                return j, (a, b)
+    return None
+
+def flow_relaxation(costs, tas, M, forbidden):
+    """
+    Returns the variable vector and objective of the min-cost flow
+    source -> TA (num_sections) -> (TA, concurrent group) gadget (1) ->
+    section (1) -> sink (SECTION_CAP), so every TA gets at most one section
+    of each concurrent group, leaving out the (TA, section) pairs in
+    forbidden. Returns None if not every TA gets num_sections sections.
+    """
+    g = flow.FlowGraph(2)
+    source, sink = 0, 1
+    sect_nodes = [g.add_node() for _ in range(M)]
+    for node in sect_nodes:
+        g.add_edge(node, sink, SECTION_CAP)
+    group_of = {}
+    if SECTS_PER_TA > 1:
+        for k, concurr_s in enumerate(CONCURR_SECTIONS):
+            for s in concurr_s:
+                group_of[s] = k
+    edges = []
+    for j, ta in enumerate(tas):
+        ta_node = g.add_node()
+        g.add_edge(source, ta_node, ta.num_sections)
+        gadgets = {}
+        for i in range(M):
+            node = ta_node
+            if i in group_of:
+                if group_of[i] not in gadgets:
+                    gadgets[group_of[i]] = g.add_node()
+                    g.add_edge(ta_node, gadgets[group_of[i]], 1)
+                node = gadgets[group_of[i]]
+            cap = 0 if (j, i) in forbidden else 1
+            edges.append(g.add_edge(node, sect_nodes[i], cap, costs[j*M+i]))
+    demand = sum(ta.num_sections for ta in tas)
+    flowed, objective = g.min_cost_flow(source, sink)
+    if flowed < demand:
+        return None
+    return [g.flow(e) for e in edges], objective
+
 def make_obj_f(tas, prioritize):
     """
-    Returns a list of coefficients for the objective function.
+    Returns an array of coefficients for the objective function, computed as
+    one expression over the rankings of all tas.
     """
-    coeffs = []
-    for ta in tas:
-        if prioritize:
-            s_rankings = [(r+1) * (max(ta.priorities)-ta.priority+1)
-                          for r in ta.rankings]
-        else:
-            s_rankings = [(r+1)**2 for r in ta.rankings]
-        coeffs.extend(s_rankings)
-    return coeffs
+    ranks = np.array([ta.rankings for ta in tas], dtype=np.int64) + 1
+    if prioritize:
+        priorities = np.array([ta.priority for ta in tas])
+        weights = priorities.max() - priorities + 1
+        return (ranks * weights[:, np.newaxis]).ravel()
+    return (ranks**2).ravel()
 
 def make_coeff_m(M, N):
     """
-    Returns a list of coefficients for the constraints matrix.
+    Returns the constraints matrix as a sparse_lp.SparseMatrix.
     """
-    m = []
+    m = sparse_lp.SparseMatrix(M*N)
     # COEFFICIENTS FOR CONSTRAINTS ON SECTION CAPS
     for x in range(M):
-        tmp_zeroes = [0 for _ in range(M*N)]
-        for y in range(x, M*N, M):
-            tmp_zeroes[y] = 1
-        m.append(tmp_zeroes)
+        m.add_row(range(x, M*N, M))
     # COEFFICIENTS FOR CONSTRAINTS ON NUMBER OF SECTIONS PER ta
     for x in range(N):
-        tmp_zeroes = [0 for _ in range(M*N)]
-        for y in range(x*M, (x+1)*M):
-            tmp_zeroes[y] = 1
-        m.append(tmp_zeroes)
+        m.add_row(range(x*M, (x+1)*M))
     # COEFFICIENTS TO PREVENT CONCURRENT SECTION ASSIGNMENT
     if SECTS_PER_TA > 1:
         for x in range(N):
-            for concurr_s in CONCURR_SECTIONS:
-                tmp_zeroes = [0 for _ in range(M*N)]
-                for s in concurr_s:
-                    tmp_zeroes[x*M+s] = 1
-                m.append(tmp_zeroes)
+            for concurr_s in CONCURR_SECTIONS + CONFLICTS:
+                m.add_row(x*M+s for s in concurr_s)
     return m
 
 def make_b_v(tas, M, N):
     """
-    Returns a list of coefficients for the b vector for constraints.
+    Returns an array of coefficients for the b vector for constraints.
     """
-    v = [SECTION_CAP for _ in range(M)] + [ta.num_sections for ta in tas]
+    v = [np.repeat(SECTION_CAP, M), np.array([ta.num_sections for ta in tas])]
     if SECTS_PER_TA > 1:
-        v += [1 for _ in range(len(CONCURR_SECTIONS) * N)]
-    return v
+        v.append(np.repeat(1, len(CONCURR_SECTIONS + CONFLICTS) * N))
+    return np.concatenate(v)
 
 def make_e_v(M, N):
     """
-    Returns a list of coefficients for the equality vector for constraints.
+    Returns an array of coefficients for the equality vector for constraints.
     """
-    v = [-1 for _ in range(M)] + [0 for _ in range(N)]
+    v = [np.repeat(-1, M), np.zeros(N, dtype=np.int64)]
     if SECTS_PER_TA > 1:
-        v += [-1 for _ in range(len(CONCURR_SECTIONS) * N)]
-    return v
+        v.append(np.repeat(-1, len(CONCURR_SECTIONS + CONFLICTS) * N))
+    return np.concatenate(v)
 
-def main(csv_file, prioritize, analyze):
+def main(csv_file, prioritize, analyze, backend, lp_out, use_cache=True,
+         invalidate=False, relax_demands=False):
+    if invalidate:
+        cache.invalidate()
     tas = import_tas(csv_file, prioritize, analyze)
-    assign_sections(tas, prioritize, analyze)
+    if relax_demands:
+        tas = relax(tas)
+    assign_sections(tas, prioritize, analyze, backend, lp_out, use_cache)
     TA.display(tas)
     # verify all sections are assigned
     sections = set()
@@ -226,11 +398,25 @@ def main(csv_file, prioritize, analyze):
     if len(sections) != len(SECTIONS):
         print 'WARNING: did not assign all section. There are {0} sections.\
         {1} have been assigned.'.format(len(SECTIONS), len(sections))
+    # verify no ta teaches two sections at once
+    for ta in tas:
+        for section in ta.sections:
+            if section in SECTION_TIMES and \
+               SECTION_INDEX.conflicts(section) & ta.sections:
+                print 'WARNING: {0} has concurrent sections {1}'.format(
+                    ta.name, sorted(ta.sections))
+                break
 
 if __name__ == '__main__':
     parser = ArgumentParser(description='creates optimal section assignment')
     parser.add_argument('-p', '--prioritize', action='store_true', help='adjusts the objective function for priorities')
     parser.add_argument('-a', '--analyze', action='store_true', help='analyze results')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend, picked by model size by default')
+    parser.add_argument('--write-lp', nargs='?', const=LP_OUT, metavar='PATH', help='export the model as .lp or .mps, optionally .gz (default: %(const)s)')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='always build and solve the model')
+    parser.add_argument('--invalidate-cache', action='store_true', help='drop all cached solutions first')
+    parser.add_argument('--relax', action='store_true', help='if the sections do not fit, lower the number of sections of the TAs who do not fit instead of failing')
     parser.add_argument('csv_file', help='csv file with section rankings')
     args = parser.parse_args()
-    main(args.csv_file, args.prioritize, args.analyze)
+    main(args.csv_file, args.prioritize, args.analyze, args.backend,
+         args.write_lp, args.use_cache, args.invalidate_cache, args.relax)
@@ -0,0 +1,257 @@
+"""
+Solver backends for the assignment models.
+
+A Model holds the objective, the sparse constraints and the variable bounds,
+and every backend turns it into a Result with the variable vector, the
+objective value, a status and timings, so runs can be compared across
+backends. The constraint matrix is built lazily, since combinatorial backends
+never need it.
+"""
+import sys
+import time
+
+import metrics
+
+OPTIMAL = 'OPTIMAL'
+SUBOPTIMAL = 'SUBOPTIMAL'
+INFEASIBLE = 'INFEASIBLE'
+UNBOUNDED = 'UNBOUNDED'
+ERROR = 'ERROR'
+# lpsolve is kept for models up to this many columns when HiGHS is available
+LPSOLVE_MAX_COLS = 20000
+# what each solver library needs, for the error when it is missing
+REQUIRES = {'lpsolve': 'the lpsolve55 module',
+            'highs': 'scipy >= 1.9 for scipy.optimize.milp, which needs '
+                     'Python 3'}
+
+class Model:
+    """
+    f: the objective coefficients, minimized
+    constraints: a function returning the (A, b, e) of sparse_lp.lp_maker
+    ub: the upper bound of each variable
+    integer: True for general integers, False for binaries
+    network: optionally a function returning the optimal variable vector
+    directly, for models a combinatorial solver can handle
+    time_limit: optionally the seconds a MIP backend may search before it
+    returns its incumbent
+    """
+
+    def __init__(self, f, constraints, ub=None, integer=False, network=None,
+                 time_limit=None):
+        self.f = f
+        self.constraints = constraints
+        self.ub = ub
+        self.integer = integer
+        self.network = network
+        self.time_limit = time_limit
+        self.A = self.b = self.e = None
+        self.build_time = 0.0
+
+    def build(self):
+        if self.A is None:
+            start = time.time()
+            with metrics.phase('build'):
+                self.A, self.b, self.e = self.constraints()
+            self.build_time = time.time() - start
+
+    def objective(self, x):
+        return sum(c * v for c, v in zip(self.f, x))
+
+class Result:
+
+    def __init__(self, backend, status, x, objective=None):
+        self.backend = backend
+        self.status = status
+        self.x = x
+        self.objective = objective
+        self.build_time = 0.0
+        self.solve_time = 0.0
+        # solver statistics such as iterations, nodes and the best bound
+        self.stats = {}
+
+    def report(self, out=sys.stderr):
+        out.write('{0}: {1}, objective {2}, build {3:.3f}s, solve {4:.3f}s\n'
+                  .format(self.backend, self.status, self.objective,
+                          self.build_time, self.solve_time))
+
+def solve_flow(model):
+    if model.network is None:
+        raise ValueError('the flow backend needs a network model')
+    try:
+        x = model.network()
+    except ValueError:
+        return Result('flow', INFEASIBLE, None)
+    return Result('flow', OPTIMAL, x, model.objective(x))
+
+def solve_lpsolve(model):
+    import lpsolve55 as lps
+    import sparse_lp
+    model.build()
+    n = len(model.f)
+    lp = sparse_lp.lp_maker(model.f, model.A, model.b, model.e, None,
+                            model.ub)
+    # set branch and bound depth to be unlimited
+    lps.lpsolve('set_bb_depthlimit', lp, 0)
+    if model.integer:
+        lps.lpsolve('set_int', lp, [1 for _ in range(n)])
+    else:
+        lps.lpsolve('set_binary', lp, [1 for _ in range(n)])
+    # set lp to minimize the objective function
+    lps.lpsolve('set_minim', lp)
+    if model.time_limit is not None:
+        lps.lpsolve('set_timeout', lp, max(1, int(model.time_limit)))
+    ret = lps.lpsolve('solve', lp)
+    status = {0: OPTIMAL, 1: SUBOPTIMAL, 2: INFEASIBLE,
+              3: UNBOUNDED}.get(ret, ERROR)
+    x, objective = None, None
+    if status in (OPTIMAL, SUBOPTIMAL):
+        x = lps.lpsolve('get_variables', lp)[0]
+        objective = lps.lpsolve('get_objective', lp)
+    result = Result('lpsolve', status, x, objective)
+    result.stats = {'iterations': lps.lpsolve('get_total_iter', lp),
+                    'nodes': lps.lpsolve('get_total_nodes', lp)}
+    lps.lpsolve('delete_lp', lp)
+    return result
+
+def _scipy_model(model):
+    """
+    Returns the model's constraint matrix as a scipy csr_matrix, with the row
+    bounds and the variable upper bounds.
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    model.build()
+    A = csr_matrix((np.frombuffer(model.A.data, dtype=np.float64),
+                    np.frombuffer(model.A.indices, dtype=np.int_),
+                    np.frombuffer(model.A.indptr, dtype=np.int_)),
+                   shape=(len(model.A), model.A.ncols))
+    b = np.asarray(model.b, dtype=float)
+    e = np.asarray(model.e)
+    lb = np.where(e < 0, -np.inf, b)
+    ub = np.where(e > 0, np.inf, b)
+    n = len(model.f)
+    var_ub = np.ones(n) if model.ub is None else np.asarray(model.ub, float)
+    return A, lb, ub, var_ub
+
+def solve_highs(model):
+    import numpy as np
+    try:
+        from scipy.optimize import Bounds, LinearConstraint, milp
+    except ImportError:
+        raise ValueError('backend highs needs ' + REQUIRES['highs'])
+    A, lb, ub, var_ub = _scipy_model(model)
+    n = len(model.f)
+    options = {}
+    if model.time_limit is not None:
+        options['time_limit'] = model.time_limit
+    res = milp(np.asarray(model.f, dtype=float),
+               constraints=LinearConstraint(A, lb, ub),
+               integrality=np.ones(n), bounds=Bounds(np.zeros(n), var_ub),
+               options=options)
+    status = {0: OPTIMAL, 1: SUBOPTIMAL, 2: INFEASIBLE,
+              3: UNBOUNDED}.get(res.status, ERROR)
+    if res.x is None:
+        result = Result('highs', status, None)
+    else:
+        result = Result('highs', status, np.round(res.x).tolist(), res.fun)
+    result.stats = {'nodes': getattr(res, 'mip_node_count', None),
+                    'bound': getattr(res, 'mip_dual_bound', None),
+                    'gap': getattr(res, 'mip_gap', None)}
+    return result
+
+def relaxation_bound(model):
+    """
+    Returns the optimum of the model's LP relaxation, a lower bound on the
+    MIP optimum, or None if no LP solver is installed.
+    """
+    if available('highs'):
+        import numpy as np
+        from scipy.optimize import linprog
+        from scipy.sparse import vstack
+        A, lb, ub, var_ub = _scipy_model(model)
+        e = np.asarray(model.e)
+        res = linprog(np.asarray(model.f, dtype=float),
+                      A_ub=vstack([A[e < 0], -A[e > 0]]),
+                      b_ub=np.concatenate([ub[e < 0], -lb[e > 0]]),
+                      A_eq=A[e == 0], b_eq=lb[e == 0],
+                      bounds=np.column_stack([np.zeros(len(var_ub)), var_ub]),
+                      method='highs')
+        return res.fun if res.status == 0 else None
+    if available('lpsolve'):
+        import lpsolve55 as lps
+        import sparse_lp
+        model.build()
+        ub = model.ub
+        if ub is None:
+            ub = [1 for _ in model.f]
+        lp = sparse_lp.lp_maker(model.f, model.A, model.b, model.e, None, ub)
+        lps.lpsolve('set_minim', lp)
+        ret = lps.lpsolve('solve', lp)
+        bound = lps.lpsolve('get_objective', lp) if ret == 0 else None
+        lps.lpsolve('delete_lp', lp)
+        return bound
+    return None
+
+BACKENDS = {'flow': solve_flow, 'lpsolve': solve_lpsolve,
+            'highs': solve_highs}
+
+def available(name):
+    """
+    Returns whether the solver library behind a backend can be imported.
+    """
+    try:
+        if name == 'lpsolve':
+            import lpsolve55
+        elif name == 'highs':
+            from scipy.optimize import milp
+    except ImportError:
+        return False
+    return name in BACKENDS
+
+def choose(model):
+    """
+    Picks a backend for model: the combinatorial solver when the model has
+    one, then lpsolve for small models and HiGHS for large ones.
+    """
+    if model.network is not None:
+        return 'flow'
+    highs = available('highs')
+    if highs and (len(model.f) > LPSOLVE_MAX_COLS or not available('lpsolve')):
+        return 'highs'
+    return 'lpsolve'
+
+def record(model, result):
+    """
+    Adds the model's size and the solver's statistics to the run metrics.
+    """
+    size = {'columns': len(model.f)}
+    if model.A is not None:
+        size.update(rows=len(model.A), nonzeros=model.A.nnz())
+    metrics.record('model', **size)
+    metrics.record('solver', backend=result.backend, status=result.status,
+                   objective=result.objective, **result.stats)
+
+def solve(model, backend='auto'):
+    """
+    Solves model with the named backend ('auto' to choose one) and returns
+    the Result, having reported it. Raises ValueError if no solution was
+    found.
+    """
+    if backend == 'auto':
+        backend = choose(model)
+    if backend not in BACKENDS:
+        raise ValueError('unknown backend: {0}'.format(backend))
+    if not available(backend):
+        raise ValueError('backend {0} is not installed: it needs {1}'.format(
+            backend, REQUIRES[backend]))
+    start = time.time()
+    with metrics.phase('solve'):
+        result = BACKENDS[backend](model)
+    result.build_time = model.build_time
+    result.solve_time = time.time() - start - model.build_time
+    result.report()
+    record(model, result)
+    if result.x is None:
+        raise ValueError('{0} found no solution: {1}'.format(backend,
+                                                             result.status))
+    return result
@@ -0,0 +1,187 @@
+"""
+Runs assign_students.py for every course of a term in one command.
+
+The manifest is a JSON file with a list of courses, e.g.
+
+    {"courses": [
+        {"name": "cs61a", "csv": "cs61a.csv",
+         "sections": [["Tu 0930-1100 AM Th 0930-1100 AM", [11, 12, 13]],
+                      ["W 0900-1030 AM F 0900-1030 AM", [29]]],
+         "section_cap": 32, "caps": {"29": 35}, "prioritize": true}],
+     "defaults": {"ignore_unknown_times": true, "seed": 3}}
+
+Every course key other than name and csv is optional. A course takes the
+options of assign_students.py's command line, named as main names them
+(closed, caps, relax, pinned, write_lp, ...), and its module constants in
+lower case (section_cap, ignore_unknown_times, ...). The manifest's defaults
+apply to every course that does not set the key itself, and anything left
+out keeps assign_students' default. Unknown keys are an error. Relative
+paths are taken from the manifest's directory. Courses are independent, so
+they are solved in a process pool, largest model first, and each course's
+section csvs are written to its own directory under the output root.
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+import assign_students
+import backends
+import cache
+import metrics
+
+BATCH_OUT = 'sections'
+# assign_students' constants a course can set, by their lower case names
+CONSTANTS = ('section_cap', 'sects_per_stud', 'default_rank', 'rank_exponent',
+             'churn_penalty', 'ignore_unknown_times')
+# assign_students' command line options, with their defaults
+OPTIONS = OrderedDict((('prioritize', False), ('debug', False),
+                       ('aggregate', False), ('backend', None),
+                       ('previous', None), ('closed', ()), ('caps', {}),
+                       ('penalty', None), ('use_cache', True),
+                       ('write_lp', None), ('budget', None),
+                       ('objective', 'weighted'), ('include', None),
+                       ('exclude', None), ('pinned', None),
+                       ('relax', False), ('seed', 0), ('metrics', None),
+                       ('profile', None), ('trace_memory', False)))
+PATHS = ('csv', 'previous', 'write_lp', 'include', 'exclude', 'pinned',
+         'metrics', 'profile')
+KEYS = set(('name', 'csv', 'out', 'sections', 'concurr_sections') +
+           CONSTANTS + tuple(OPTIONS))
+
+def load_manifest(path):
+    """
+    Returns the courses of the manifest at path, with their paths resolved.
+    """
+    with open(path) as f:
+        manifest = json.load(f, object_pairs_hook=OrderedDict)
+    defaults = manifest.get('defaults', {})
+    for key in defaults:
+        if key not in KEYS or key in ('name', 'csv', 'out'):
+            raise ValueError('unknown default: {0}'.format(key))
+    base = os.path.dirname(os.path.abspath(path))
+    courses = []
+    names = set()
+    for course in manifest['courses']:
+        for key in course:
+            if key not in KEYS:
+                raise ValueError('course {0} has an unknown key: {1}'.format(
+                    course.get('name', len(names)), key))
+        course, options = OrderedDict(defaults), course
+        course.update(options)
+        for key in ('name', 'csv'):
+            if key not in course:
+                raise ValueError('course {0} has no {1}'.format(
+                    course.get('name', len(names)), key))
+        if course['name'] in names:
+            raise ValueError('course {0} is listed twice'.format(
+                course['name']))
+        names.add(course['name'])
+        for key in PATHS:
+            if course.get(key) and course[key] != '-':
+                course[key] = os.path.join(base, course[key])
+        courses.append(course)
+    return courses
+
+def model_size(course):
+    """
+    Estimates the number of model columns of a course, students times time
+    slots, to schedule the largest models first.
+    """
+    with open(course['csv'], 'rU') as f:
+        N = max(sum(1 for _ in f) - 1, 0)
+    M = len(course.get('sections', assign_students.SECTIONS))
+    return N * M
+
+def configure(course):
+    """
+    Points assign_students' constants at the course. Each course runs in a
+    fresh worker, so constants the course leaves out keep their defaults.
+    """
+    a = assign_students
+    if 'sections' in course:
+        a.SECTIONS = OrderedDict((slot, tuple(sects))
+                                 for slot, sects in course['sections'])
+    if 'concurr_sections' in course:
+        a.CONCURR_SECTIONS = tuple(tuple(g)
+                                   for g in course['concurr_sections'])
+    for key in CONSTANTS:
+        if key in course:
+            setattr(a, key.upper(), course[key])
+
+def run_course(course, out_root, backend, use_cache):
+    """
+    Assigns one course and returns its (name, status, seconds, message).
+    backend and use_cache apply unless the course sets its own.
+    """
+    start = time.time()
+    out = os.path.join(out_root, course.get('out', course['name']))
+    o = dict(OPTIONS, backend=backend, use_cache=use_cache)
+    o.update(course)
+    try:
+        configure(course)
+        if not os.path.isdir(out):
+            os.makedirs(out)
+        a = assign_students
+        caps = dict((int(s), c) for s, c in o['caps'].items())
+        if o['metrics'] or o['profile'] or o['trace_memory']:
+            metrics.start(o['profile'], o['trace_memory'])
+        try:
+            a.main(course['csv'], o['prioritize'], o['debug'], o['aggregate'],
+                   o['backend'], o['previous'], o['closed'], caps,
+                   a.CHURN_PENALTY if o['penalty'] is None else o['penalty'],
+                   o['use_cache'], False, o['write_lp'], out, o['budget'],
+                   o['include'] and a.load_emails(o['include']),
+                   o['exclude'] and a.load_emails(o['exclude']),
+                   o['pinned'] and a.load_pins(o['pinned']), o['objective'],
+                   o['relax'], o['seed'])
+        finally:
+            metrics.emit(o['metrics'])
+    except Exception:
+        return (course['name'], 'FAILED', time.time() - start,
+                traceback.format_exc())
+    return course['name'], 'OK', time.time() - start, out
+
+def _run(args):
+    return run_course(*args)
+
+def main(manifest, out_root, backend, processes, use_cache,
+         invalidate=False):
+    courses = load_manifest(manifest)
+    if invalidate:
+        cache.invalidate()
+    courses.sort(key=model_size, reverse=True)
+    start = time.time()
+    # one course per worker, so no course sees another's constants
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    failed = 0
+    try:
+        for name, status, seconds, message in pool.imap_unordered(
+                _run, [(c, out_root, backend, use_cache) for c in courses]):
+            print '{0}: {1} in {2:.2f}s'.format(name, status, seconds)
+            if status != 'OK':
+                failed += 1
+                sys.stderr.write(message)
+    finally:
+        pool.close()
+        pool.join()
+    print '{0} courses, {1} failed, {2:.2f}s'.format(len(courses), failed,
+                                                     time.time() - start)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='assigns sections for every course in a manifest')
+    parser.add_argument('-o', '--out', default=BATCH_OUT, help='directory for the per-course section csvs')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend for courses that do not set one')
+    parser.add_argument('-j', '--processes', type=int, help='worker processes, one per core by default')
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='always build and solve the models')
+    parser.add_argument('--invalidate-cache', action='store_true', help='drop all cached solutions first')
+    parser.add_argument('manifest', help='json manifest of courses')
+    args = parser.parse_args()
+    main(args.manifest, args.out, args.backend, args.processes,
+         args.use_cache, args.invalidate_cache)
@@ -0,0 +1,188 @@
+"""
+Scaling benchmarks for assign_students.py.
+
+Generates synthetic cohorts over a grid of student counts (N) and time slot
+counts (M), times every phase of a run separately and records the peak RSS.
+Each case runs in its own process so peak memory is per case. Results are
+written as JSON and can be compared against a stored baseline.
+"""
+import csv
+import json
+import math
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS, ArgumentParser
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import assign_students
+import backends
+import lp_writer
+import sparse_lp
+
+NS = (1000, 10000, 100000)
+MS = (10, 50, 200)
+SECTS_PER_SLOT = 2
+NUM_CHOICES = 5
+OVERCAPACITY = 1.1
+# a phase regresses if it is this much slower than the baseline ...
+TOLERANCE = 0.25
+# ... and at least this many seconds slower
+MIN_DELTA = 0.05
+
+@contextmanager
+def timer(phases, name):
+    start = time.time()
+    yield
+    phases[name] = time.time() - start
+
+def configure(N, M):
+    """
+    Points assign_students at a catalog of M slots with enough seats for N
+    students.
+    """
+    slots = ['Slot {0:03d}'.format(i) for i in range(M)]
+    assign_students.SECTIONS = OrderedDict(
+        (slot, tuple(100 + i*SECTS_PER_SLOT + k for k in range(SECTS_PER_SLOT)))
+        for i, slot in enumerate(slots))
+    assign_students.SECTION_CAP = int(math.ceil(
+        OVERCAPACITY * N / (M * SECTS_PER_SLOT)))
+    return slots
+
+def write_cohort(path, N, slots, seed=0):
+    rand = random.Random(seed)
+    with open(path, 'wb') as f:
+        csvwriter = csv.writer(f)
+        csvwriter.writerow(['Timestamp', 'Name', 'Email', 'SID'] +
+                           ['Choice {0}'.format(k+1)
+                            for k in range(NUM_CHOICES)])
+        for j in range(N):
+            csvwriter.writerow(['8/8/2008 20:08:08', 'Student {0}'.format(j),
+                                's{0}@berkeley.edu'.format(j), j] +
+                               rand.sample(slots, min(NUM_CHOICES, len(slots))))
+
+def run_case(N, M, backend):
+    """
+    Runs one benchmark case in this process and returns its record.
+    """
+    a = assign_students
+    slots = configure(N, M)
+    tmp = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        path = os.path.join(tmp, 'cohort.csv')
+        write_cohort(path, N, slots)
+        phases = OrderedDict()
+        with timer(phases, 'import_students'):
+            students = a.import_students(path)
+        with timer(phases, 'make_obj_f'):
+            f = a.make_obj_f(students, False)
+        with timer(phases, 'make_coeff_m'):
+            A = a.make_coeff_m(M, N)
+        with timer(phases, 'make_b_v'):
+            b = a.make_b_v(students, M, N)
+        with timer(phases, 'make_e_v'):
+            e = a.make_e_v(M, N)
+        v = [1 for _ in range(M*N)]
+        network = None
+        if a.is_network():
+            network = lambda: a.solve_flow(f, students, M)
+        model = backends.Model(f, lambda: (A, b, e), v, network=network)
+        with timer(phases, 'write_lp'):
+            lp_writer.write_model(os.path.join(tmp, 'out.lp'), model)
+        if backend == 'auto':
+            backend = backends.choose(model)
+        if backend == 'lpsolve':
+            import lpsolve55 as lps
+            with timer(phases, 'lp_maker'):
+                lp = sparse_lp.lp_maker(f, A, b, e, None, v)
+                lps.lpsolve('set_binary', lp, v)
+                lps.lpsolve('set_minim', lp)
+            with timer(phases, 'solve'):
+                lps.lpsolve('solve', lp)
+            res = lps.lpsolve('get_variables', lp)[0]
+            lps.lpsolve('delete_lp', lp)
+        else:
+            with timer(phases, 'solve'):
+                res = backends.BACKENDS[backend](model).x
+        with timer(phases, 'parse_results'):
+            a.parse_results(res, students, M)
+        os.chdir(tmp)
+        with timer(phases, 'output_csvs'):
+            a.output_csvs(students)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+    return OrderedDict((('N', N), ('M', M), ('backend', backend),
+                        ('phases', phases),
+                        ('peak_rss_kb', resource.getrusage(
+                            resource.RUSAGE_SELF).ru_maxrss)))
+
+def run_grid(ns, ms, backend):
+    cases = []
+    for N in ns:
+        for M in ms:
+            out = subprocess.check_output([sys.executable, __file__, '--case',
+                                           str(N), str(M), '-b', backend])
+            case = json.loads(out, object_pairs_hook=OrderedDict)
+            print '{0} x {1}: {2:.2f}s, {3} KB peak'.format(
+                N, M, sum(case['phases'].values()), case['peak_rss_kb'])
+            cases.append(case)
+    return cases
+
+def compare(cases, baseline):
+    """
+    Prints every phase that got slower than the baseline and returns how many
+    did.
+    """
+    base = dict(((c['N'], c['M']), c) for c in baseline['cases'])
+    regressions = 0
+    for case in cases:
+        old = base.get((case['N'], case['M']))
+        if old is None:
+            continue
+        for phase, t in case['phases'].items():
+            t0 = old['phases'].get(phase)
+            if t0 is not None and t > t0 * (1 + TOLERANCE) and \
+               t - t0 > MIN_DELTA:
+                regressions += 1
+                print 'REGRESSION {0} x {1} {2}: {3:.3f}s -> {4:.3f}s'.format(
+                    case['N'], case['M'], phase, t0, t)
+    return regressions
+
+def main(ns, ms, backend, out, baseline, save_baseline):
+    cases = run_grid(ns, ms, backend)
+    record = OrderedDict((('python', sys.version.split()[0]),
+                          ('date', time.strftime('%Y-%m-%d %H:%M:%S')),
+                          ('cases', cases)))
+    with open(out, 'w') as f:
+        json.dump(record, f, indent=2)
+    if save_baseline:
+        shutil.copy(out, baseline)
+    elif os.path.exists(baseline):
+        with open(baseline) as f:
+            if compare(cases, json.load(f)):
+                sys.exit(1)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='benchmarks each phase of a run')
+    parser.add_argument('-n', type=int, nargs='+', default=NS, help='student counts')
+    parser.add_argument('-m', type=int, nargs='+', default=MS, help='time slot counts')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend')
+    parser.add_argument('-o', '--out', default='bench.json', help='where to write the results')
+    parser.add_argument('--baseline', default='bench_baseline.json', help='results to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--case', type=int, nargs=2, metavar=('N', 'M'), help=SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        json.dump(run_case(args.case[0], args.case[1], args.backend),
+                  sys.stdout)
+    else:
+        main(args.n, args.m, args.backend, args.out, args.baseline,
+             args.save_baseline)
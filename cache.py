@@ -0,0 +1,123 @@
+"""
+On-disk cache of solved assignments.
+
+Entries are keyed by a hash of everything the model depends on: the ranking
+matrix, priorities and section counts in a canonical student order, plus the
+section catalog and objective settings. An entry holds the 0/1 variable
+vector in that canonical order and the objective value, so a rerun with the
+same inputs can skip straight to decoding. The least recently used entries
+are evicted once the cache grows past CACHE_MAX_BYTES.
+
+Several runs may share the cache (see batch). Entries are written to a
+TMP_PREFIX file and renamed into place, eviction leaves those files alone,
+and a file another run removed first is simply skipped. A failed write only
+costs the cache entry: store warns instead of raising, so it never fails a
+solve.
+"""
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+CACHE_DIR = '.assign_cache'
+CACHE_MAX_BYTES = 256 * 2**20
+# prefix of entries still being written, which eviction skips
+TMP_PREFIX = '.tmp-'
+
+def model_key(arrays, config):
+    """
+    Returns the hex digest of the given arrays and the repr of config.
+    """
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str(a.dtype) + str(a.shape))
+        h.update(a.tobytes())
+    h.update(repr(config))
+    return h.hexdigest()
+
+def _path(key, directory):
+    return os.path.join(directory, key + '.npz')
+
+def load(key, directory=CACHE_DIR):
+    """
+    Returns the (res, objective, status) stored under key, or None.
+    """
+    path = _path(key, directory)
+    try:
+        with np.load(path) as entry:
+            hit = (entry['res'], entry['objective'].item(),
+                   str(entry['status']))
+    except (IOError, KeyError, ValueError):
+        return None
+    # mark the entry as recently used, unless it was just evicted
+    _ignore_missing(os.utime, path, None)
+    return hit
+
+def _ignore_missing(f, *args):
+    """
+    Calls f(*args), returning None if its file was removed meanwhile.
+    """
+    try:
+        return f(*args)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+def store(key, res, objective, status, directory=CACHE_DIR,
+          max_bytes=CACHE_MAX_BYTES):
+    """
+    Stores a solution under key, then evicts the least recently used entries
+    until the cache fits in max_bytes. Warns instead of raising if the cache
+    cannot be written.
+    """
+    try:
+        _write(key, res, objective, status, directory)
+        evict(directory, max_bytes)
+    except (IOError, OSError) as e:
+        sys.stderr.write('cache: could not store {0}: {1}\n'.format(key, e))
+
+def _write(key, res, objective, status, directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    fd, tmp = tempfile.mkstemp(prefix=TMP_PREFIX, suffix='.npz',
+                               dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez_compressed(f, res=np.asarray(res, dtype=np.uint8),
+                                objective=objective, status=status)
+        os.rename(tmp, _path(key, directory))
+    except:
+        _ignore_missing(os.remove, tmp)
+        raise
+
+def evict(directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    entries = []
+    for fn in os.listdir(directory):
+        if fn.startswith(TMP_PREFIX):
+            continue
+        path = os.path.join(directory, fn)
+        st = _ignore_missing(os.stat, path)
+        if st is not None:
+            entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        _ignore_missing(os.remove, path)
+        total -= size
+
+def invalidate(directory=CACHE_DIR):
+    """
+    Drops every cached solution.
+    """
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
@@ -0,0 +1,158 @@
+"""
+Resolution of duplicate form submissions.
+
+Two rows are the same person if at least two of their email, SID and name
+agree, so a resubmission with a corrected email, a typo in the name or a
+mistyped SID is still caught. Two of three fields agree exactly when one of
+the three pairs of fields does, so each pair has its own hash index and a row
+is resolved by three exact lookups, however many earlier rows share one of
+its fields (a common name, say). Of the rows of one person the one with the
+latest Timestamp wins, and the row read last wins a tie, which makes the
+result independent of the export's order up to ties. The pairs of every row
+of a person stay indexed to the person's record, the superseded rows' too, so
+a later row matching any earlier one on two fields is still caught.
+
+The index maps the hash of a pair to a bare record index, and the records
+are kept in columns (SIDs, timestamps and line numbers in typed arrays,
+names interned), so a record costs a few machine words rather than a tuple
+of tuples. Only a record merged from rows with different fields also keeps
+the fields of its other rows. A hash shared by two different pairs is told
+apart by comparing the fields.
+"""
+import sys
+from array import array
+from datetime import datetime
+
+# Timestamp formats of form exports, tried in order
+TIMESTAMP_FORMATS = ('%m/%d/%Y %H:%M:%S', '%m/%d/%Y')
+FIELDS = ('email', 'sid', 'name')
+# the pairs of FIELDS indexed, as positions into a row's keys
+PAIRS = ((0, 1), (0, 2), (1, 2))
+EPOCH = datetime(1970, 1, 1)
+
+def parse_timestamp(s):
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(s.strip(), fmt)
+        except ValueError:
+            pass
+    raise ValueError('bad timestamp: {0}'.format(s))
+
+def normalize_name(name):
+    return ' '.join(name.lower().split())
+
+def _seconds(stamp):
+    delta = stamp - EPOCH
+    return delta.days * 86400 + delta.seconds
+
+class Deduper:
+    """
+    Keeps one record per person. add returns the record index of a row and
+    whether the row should replace that record's data.
+    """
+
+    def __init__(self):
+        # hash of a pair of keys, and which pair it is, -> record index, or
+        # a tuple of record indices for the rare hash shared by several
+        # records; one dict for all three pairs keeps a single hash table
+        self.index = {}
+        # the email, SID and normalized name of every record
+        self.columns = ([], array('l'), [])
+        # record index -> the keys of its other rows, where they differ
+        self.older = {}
+        self.stamps = array('l')
+        self.lines = array('l')
+        # (kept line, dropped line, fields that matched)
+        self.merges = []
+
+    def keys(self, j):
+        return tuple(column[j] for column in self.columns)
+
+    def _rows(self, j):
+        """
+        Returns the keys of every row merged into record j, latest first.
+        """
+        return (self.keys(j),) + self.older.get(j, ())
+
+    def _hashes(self, keys):
+        return [(a, b, hash((k, keys[a], keys[b])))
+                for k, (a, b) in enumerate(PAIRS)]
+
+    def _match(self, keys):
+        """
+        Returns the lowest record index sharing at least two keys, or None.
+        """
+        matches = []
+        for a, b, h in self._hashes(keys):
+            js = self.index.get(h, ())
+            for j in (js,) if isinstance(js, int) else js:
+                for row in self._rows(j):
+                    if row[a] == keys[a] and row[b] == keys[b]:
+                        matches.append(j)
+                        break
+        return min(matches) if matches else None
+
+    def _index(self, j, keys):
+        for _, _, h in self._hashes(keys):
+            js = self.index.get(h)
+            if js is None:
+                self.index[h] = j
+            elif js != j and (isinstance(js, int) or j not in js):
+                self.index[h] = ((js,) if isinstance(js, int) else js) + (j,)
+
+    def _merge(self, j, keys, latest):
+        """
+        Makes latest the keys of record j and keeps keys, of another of its
+        rows, indexed under j alongside.
+        """
+        rows = tuple(row for row in self._rows(j) + (keys,) if row != latest)
+        for column, key in zip(self.columns, latest):
+            column[j] = key
+        older = tuple(row for n, row in enumerate(rows)
+                      if row not in rows[:n])
+        if older:
+            self.older[j] = older
+        self._index(j, keys)
+        self._index(j, latest)
+
+    def add(self, email, sid, name, timestamp, line):
+        """
+        email should already be normalized, e.g. by fix_email, and sid is
+        an int. Returns (j, replace), where j is the record index of the
+        row, a new one if it is nobody's resubmission, and replace tells
+        whether the row's data should be stored as record j.
+        """
+        lower = email.lower()
+        keys = (email if lower == email else lower, sid,
+                intern(normalize_name(name)))
+        stamp = _seconds(parse_timestamp(timestamp))
+        j = self._match(keys)
+        if j is None:
+            j = len(self.lines)
+            for column, key in zip(self.columns, keys):
+                column.append(key)
+            self.stamps.append(stamp)
+            self.lines.append(line)
+            self._index(j, keys)
+            return j, True
+        matched = max((tuple(f for f, a, b in zip(FIELDS, keys, row)
+                             if a == b) for row in self._rows(j)), key=len)
+        if stamp < self.stamps[j]:
+            self.merges.append((self.lines[j], line, matched))
+            self._merge(j, keys, self.keys(j))
+            return j, False
+        self.merges.append((line, self.lines[j], matched))
+        self._merge(j, self.keys(j), keys)
+        self.stamps[j] = stamp
+        self.lines[j] = line
+        return j, True
+
+    def report(self, verbose=False, out=sys.stderr):
+        if not self.merges:
+            return
+        out.write('dedupe: {0} resubmissions merged\n'.format(
+            len(self.merges)))
+        if verbose:
+            for kept, dropped, matched in self.merges:
+                out.write('  row {0} supersedes row {1} (same {2})\n'.format(
+                    kept, dropped, ' and '.join(matched)))
@@ -0,0 +1,122 @@
+"""
+Feasibility pre-check for the assignment models.
+
+The equality rows of a model ask for every row (student or TA) to get exactly
+its number of columns (time slots or sections). Whether that is possible is
+a max-flow question on
+
+    source -> row (demand) -> [row's concurrent group (1)] -> column (1)
+           -> sink (capacity)
+
+which is answered before any model is built. Rows with the same demand and
+the same allowed columns are interchangeable, so each such type is one node
+with its edge capacities multiplied by its size, and the graph stays tiny
+however many rows there are.
+
+When the flow falls short, the nodes the source still reaches in the
+residual graph form the minimal minimum cut: full columns and the rows that
+have nowhere else to go, a violator of Hall's condition. A column in several
+concurrent groups is kept in its first group only, so with overlapping
+groups the check is a relaxation: it never rejects a feasible model, but an
+infeasible one can pass it.
+"""
+import sys
+from collections import OrderedDict
+
+import flow
+
+# rows named in a report before the rest are summed up
+REPORT_NAMES = 10
+
+class Shortfall:
+    """
+    needed: the placements the model asks for
+    possible: the most placements that fit
+    columns: the indices of the oversubscribed columns
+    rows: the indices of the rows competing for them
+    placed: how many columns each row gets in a largest placement
+    """
+
+    def __init__(self, needed, possible, columns, rows, placed):
+        self.needed = needed
+        self.possible = possible
+        self.columns = columns
+        self.rows = rows
+        self.placed = placed
+
+    def report(self, row_names, column_names, rows='rows', columns='columns',
+               capacity=None, out=sys.stderr):
+        out.write('infeasible: {0} placements needed, at most {1} fit\n'
+                  .format(self.needed, self.possible))
+        names = [str(row_names[j]) for j in self.rows[:REPORT_NAMES]]
+        if len(self.rows) > REPORT_NAMES:
+            names.append('and {0} more'.format(len(self.rows) - REPORT_NAMES))
+        if not self.columns:
+            out.write('  {0} {1} need more {2} than they may hold: {3}\n'
+                      .format(len(self.rows), rows, columns, ', '.join(names)))
+            return
+        seats = ''
+        if capacity is not None:
+            seats = ' with {0} places'.format(sum(capacity[i]
+                                                  for i in self.columns))
+        out.write('  oversubscribed: {0} {1}{2}: {3}\n'.format(
+            len(self.columns), columns, seats,
+            ', '.join(str(column_names[i]) for i in self.columns)))
+        out.write('  competing for them: {0} {1}: {2}\n'.format(
+            len(self.rows), rows, ', '.join(names)))
+
+def check(demands, caps, groups=(), allowed=None):
+    """
+    demands: the number of columns each row needs
+    caps: the capacity of each column
+    groups: tuples of columns no row may hold two of
+    allowed: optionally an N x M array of which columns each row may take,
+    all of them by default
+    Returns None if every row can be placed, else a Shortfall.
+    """
+    M = len(caps)
+    group_of = {}
+    for k, group in enumerate(groups):
+        for i in group:
+            group_of.setdefault(i, k)
+    types = OrderedDict()
+    for j, d in enumerate(demands):
+        mask = tuple(range(M)) if allowed is None else \
+            tuple(i for i in range(M) if allowed[j][i])
+        types.setdefault((d, mask), []).append(j)
+    g = flow.FlowGraph(2)
+    source, sink = 0, 1
+    cols = [g.add_node() for _ in range(M)]
+    for i in range(M):
+        g.add_edge(cols[i], sink, caps[i])
+    nodes, edges = [], []
+    for (d, mask), members in types.items():
+        n = len(members)
+        node = g.add_node()
+        nodes.append(node)
+        edges.append(g.add_edge(source, node, d * n))
+        gadgets = {}
+        for i in mask:
+            via = node
+            if i in group_of:
+                if group_of[i] not in gadgets:
+                    gadgets[group_of[i]] = g.add_node()
+                    g.add_edge(node, gadgets[group_of[i]], n)
+                via = gadgets[group_of[i]]
+            g.add_edge(via, cols[i], n)
+    needed = sum(demands)
+    possible, _ = g.min_cost_flow(source, sink)
+    if possible == needed:
+        return None
+    side = g.reachable(source)
+    placed = [0 for _ in demands]
+    rows = []
+    for node, e, members in zip(nodes, edges, types.values()):
+        # deal the type's placements out evenly, so none exceeds its demand
+        base, extra = divmod(g.flow(e), len(members))
+        for k, j in enumerate(members):
+            placed[j] = base + (k < extra)
+        if node in side:
+            rows.extend(members)
+    columns = [i for i in range(M) if cols[i] in side]
+    return Shortfall(needed, possible, columns, sorted(rows), placed)
@@ -0,0 +1,228 @@
+"""
+Min-cost flow for the assignment models.
+
+Without the "at most one of each concurrent group" rows, assigning students to
+sections is a transportation problem: source -> student (supply num_sections)
+-> section (capacity 1 per student) -> sink (section capacity). Its constraint
+matrix is totally unimodular, so successive shortest paths reaches an integral
+optimum directly, with no branch and bound.
+
+Sections are few and students are many, so students are never made graph
+nodes. Moving student u from section i to section j is collapsed into one
+i -> j arc of cost costs[u][j] - costs[u][i], and every (i, j) pair keeps a
+heap of the students in i ordered by that cost. Each augmentation is then a
+Dijkstra over the sections alone.
+
+FlowGraph is a plain min-cost flow on an explicit graph, for models whose
+extra structure (such as per-TA concurrency gadgets) needs real nodes.
+"""
+import heapq
+
+INF = float('inf')
+
+def min_cost_assignment(costs, caps, demands=None):
+    """
+    costs: costs[u][i] is the cost of giving row u section i
+    caps: the capacity of each section
+    demands: the number of sections each row needs, 1 by default
+    Returns (assignment, objective), where assignment[u] is the sorted list
+    of sections given to row u. Raises ValueError if no feasible assignment
+    exists.
+    """
+    M = len(caps)
+    N = len(costs)
+    if demands is None:
+        demands = [1 for _ in range(N)]
+    free = list(caps)
+    held = [set() for _ in range(N)]
+    # moves[i][j] holds (costs[u][j] - costs[u][i], u) for the u in section i
+    moves = [[[] for _ in range(M)] for _ in range(M)]
+    pot = [0 for _ in range(M)]
+    pot_t = 0
+    for u in range(N):
+        for _ in range(demands[u]):
+            dist, pred, dist_t, end = _shortest_path(u, costs, held, free,
+                                                     moves, pot, pot_t)
+            if end is None:
+                raise ValueError('no feasible assignment: row {0} cannot be '
+                                 'placed'.format(u))
+            for i in range(M):
+                pot[i] += min(dist[i], dist_t)
+            pot_t += dist_t
+            _augment(end, pred, costs, held, moves)
+            free[end] -= 1
+    assignment = [sorted(h) for h in held]
+    objective = sum(costs[u][i] for u in range(N) for i in held[u])
+    return assignment, objective
+
+def _top(heap, held, i, j):
+    """
+    Returns the cheapest valid i -> j move, dropping stale entries.
+    """
+    while heap:
+        u = heap[0][1]
+        if i in held[u] and j not in held[u]:
+            return heap[0]
+        heapq.heappop(heap)
+    return None
+
+def _shortest_path(u, costs, held, free, moves, pot, pot_t):
+    """
+    Dijkstra on reduced costs from row u to the sink. Returns the section
+    labels, the predecessor of each section as (section, student) or
+    (None, u), the distance to the sink and the section the path leaves from.
+    """
+    M = len(pot)
+    cu = costs[u]
+    dist = [INF for _ in range(M)]
+    pred = [None for _ in range(M)]
+    heap = []
+    for i in range(M):
+        if i not in held[u]:
+            dist[i] = cu[i] - pot[i]
+            pred[i] = (None, u)
+            heap.append((dist[i], i))
+    heapq.heapify(heap)
+    done = [False for _ in range(M)]
+    dist_t, end = INF, None
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d >= dist_t:
+            break
+        if done[i] or d > dist[i]:
+            continue
+        done[i] = True
+        if free[i] > 0 and d + pot[i] - pot_t < dist_t:
+            dist_t, end = d + pot[i] - pot_t, i
+            if dist_t <= d:
+                break
+        for j in range(M):
+            if done[j]:
+                continue
+            top = _top(moves[i][j], held, i, j)
+            if top is None:
+                continue
+            nd = d + top[0] + pot[i] - pot[j]
+            if nd < dist[j]:
+                dist[j] = nd
+                pred[j] = (i, top[1])
+                heapq.heappush(heap, (nd, j))
+    return dist, pred, dist_t, end
+
+def _augment(end, pred, costs, held, moves):
+    """
+    Applies the moves along the path ending at section end.
+    """
+    j = end
+    while True:
+        i, v = pred[j]
+        if i is not None:
+            held[v].remove(i)
+            # v's moves from its other sections into i are open again
+            for k in held[v]:
+                heapq.heappush(moves[k][i], (costs[v][i] - costs[v][k], v))
+        held[v].add(j)
+        for k in range(len(moves)):
+            if k not in held[v]:
+                heapq.heappush(moves[j][k], (costs[v][k] - costs[v][j], v))
+        if i is None:
+            break
+        j = i
+
+class FlowGraph:
+    """
+    A directed graph with capacities and costs for general min-cost flow.
+    Edge e and its residual edge e ^ 1 are stored next to each other.
+    """
+
+    def __init__(self, n=0):
+        self.adj = [[] for _ in range(n)]
+        self.to = []
+        self.cap = []
+        self.cost = []
+
+    def add_node(self):
+        self.adj.append([])
+        return len(self.adj) - 1
+
+    def add_edge(self, u, v, cap, cost=0):
+        """
+        Adds an edge from u to v and returns its index.
+        """
+        e = len(self.to)
+        self.to.extend((v, u))
+        self.cap.extend((cap, 0))
+        self.cost.extend((cost, -cost))
+        self.adj[u].append(e)
+        self.adj[v].append(e + 1)
+        return e
+
+    def flow(self, e):
+        """
+        Returns the flow currently on edge e.
+        """
+        return self.cap[e ^ 1]
+
+    def min_cost_flow(self, s, t, limit=INF):
+        """
+        Sends up to limit units from s to t by successive shortest paths and
+        returns (flow, cost). Edge costs must be nonnegative.
+        """
+        n = len(self.adj)
+        pot = [0 for _ in range(n)]
+        total_flow, total_cost = 0, 0
+        while total_flow < limit:
+            dist = [INF for _ in range(n)]
+            pred = [None for _ in range(n)]
+            dist[s] = 0
+            heap = [(0, s)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                for e in self.adj[u]:
+                    if self.cap[e] <= 0:
+                        continue
+                    v = self.to[e]
+                    nd = d + self.cost[e] + pot[u] - pot[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        pred[v] = e
+                        heapq.heappush(heap, (nd, v))
+            if dist[t] == INF:
+                break
+            for u in range(n):
+                if dist[u] < INF:
+                    pot[u] += dist[u]
+            push = limit - total_flow
+            v = t
+            while v != s:
+                e = pred[v]
+                push = min(push, self.cap[e])
+                v = self.to[e ^ 1]
+            v = t
+            while v != s:
+                e = pred[v]
+                self.cap[e] -= push
+                self.cap[e ^ 1] += push
+                v = self.to[e ^ 1]
+            total_flow += push
+            total_cost += push * (pot[t] - pot[s])
+        return total_flow, total_cost
+
+    def reachable(self, s):
+        """
+        Returns the set of nodes reachable from s along edges with capacity
+        left. After a maximum flow, these are the source side of the minimum
+        cut closest to s.
+        """
+        seen = set([s])
+        stack = [s]
+        while stack:
+            u = stack.pop()
+            for e in self.adj[u]:
+                v = self.to[e]
+                if self.cap[e] > 0 and v not in seen:
+                    seen.add(v)
+                    stack.append(v)
+        return seen
@@ -0,0 +1,107 @@
+"""
+Streaming LP and free-MPS writers for backends.Model.
+
+The file is written straight from the sparse model in one pass, without
+building the model inside a solver first. Binaries are declared as such
+rather than bounded one variable at a time. A path ending in .gz is written
+gzip-compressed.
+"""
+import gzip
+
+import numpy as np
+
+# terms per line in LP files
+TERMS_PER_LINE = 8
+
+def write_model(path, model):
+    """
+    Writes model to path, as free MPS if the name ends in .mps or .mps.gz and
+    in lp_solve's LP format otherwise.
+    """
+    model.build()
+    opener = gzip.open if path.endswith('.gz') else open
+    name = path[:-3] if path.endswith('.gz') else path
+    with opener(path, 'wb') as out:
+        if name.endswith('.mps'):
+            write_mps(out, model)
+        else:
+            write_lp(out, model)
+
+def _num(x):
+    return '{0:.12g}'.format(float(x))
+
+def _term(c, j):
+    if c == 1:
+        return '+C{0}'.format(j+1)
+    elif c == -1:
+        return '-C{0}'.format(j+1)
+    return '{0:+.12g} C{1}'.format(float(c), j+1)
+
+def _write_terms(out, terms):
+    for k, term in enumerate(terms):
+        if k and k % TERMS_PER_LINE == 0:
+            out.write('\n')
+        out.write(term if k % TERMS_PER_LINE == 0 else ' ' + term)
+
+def _write_list(out, keyword, cols):
+    out.write('\n{0} '.format(keyword))
+    _write_terms(out, ('C{0}{1}'.format(j+1, ',' if k < len(cols) - 1 else '')
+                       for k, j in enumerate(cols)))
+    out.write(';\n')
+
+def write_lp(out, model):
+    out.write('/* Objective function */\nmin: ')
+    _write_terms(out, (_term(c, j) for j, c in enumerate(model.f) if c))
+    out.write(';\n\n/* Constraints */\n')
+    for i, (cols, vals) in enumerate(model.A.rows()):
+        # a label keeps single variable rows from being read as bounds
+        out.write('R{0}: '.format(i+1))
+        _write_terms(out, (_term(v, j) for j, v in zip(cols, vals)))
+        e = model.e[i]
+        op = '<=' if e < 0 else '=' if e == 0 else '>='
+        out.write(' {0} {1};\n'.format(op, _num(model.b[i])))
+    cols = range(len(model.f))
+    if model.integer:
+        if model.ub is not None:
+            out.write('\n')
+            for j, u in enumerate(model.ub):
+                out.write('C{0} <= {1};\n'.format(j+1, _num(u)))
+        _write_list(out, 'int', cols)
+    else:
+        _write_list(out, 'bin', cols)
+
+def write_mps(out, model):
+    A = model.A
+    nrows = len(A)
+    out.write('NAME assign\nROWS\n N COST\n')
+    for i in range(nrows):
+        e = model.e[i]
+        out.write(' {0} R{1}\n'.format('L' if e < 0 else 'E' if e == 0
+                                       else 'G', i+1))
+    # MPS is column-major, so regroup the CSR entries by column
+    indices = np.frombuffer(A.indices, dtype=np.int_)
+    data = np.frombuffer(A.data, dtype=np.float64)
+    row_of = np.repeat(np.arange(nrows),
+                       np.diff(np.frombuffer(A.indptr, dtype=np.int_)))
+    order = np.argsort(indices, kind='mergesort')
+    colptr = np.concatenate(([0], np.cumsum(np.bincount(
+        indices, minlength=A.ncols))))
+    out.write("COLUMNS\n MARKER 'MARKER' 'INTORG'\n")
+    for j, c in enumerate(model.f):
+        if c:
+            out.write(' C{0} COST {1}\n'.format(j+1, _num(c)))
+        for k in order[colptr[j]:colptr[j+1]]:
+            out.write(' C{0} R{1} {2}\n'.format(j+1, row_of[k]+1,
+                                                _num(data[k])))
+    out.write(" MARKER 'MARKER' 'INTEND'\nRHS\n")
+    for i in range(nrows):
+        if model.b[i]:
+            out.write(' RHS R{0} {1}\n'.format(i+1, _num(model.b[i])))
+    out.write('BOUNDS\n')
+    for j in range(len(model.f)):
+        if model.integer:
+            ub = 1 if model.ub is None else model.ub[j]
+            out.write(' UI BND C{0} {1}\n'.format(j+1, _num(ub)))
+        else:
+            out.write(' BV BND C{0}\n'.format(j+1))
+    out.write('ENDATA\n')
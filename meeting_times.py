@@ -0,0 +1,112 @@
+"""
+Meeting times of the section catalog and the conflicts between them.
+
+A time slot such as 'M 0330-0500 PM W 0400-0530 PM' is parsed into weekly
+intervals of minutes since Monday midnight. IntervalIndex sweeps over those
+intervals once to build the conflict graph. Sections with the same meeting
+times form disjoint groups, the "at most one of these" groups of the models,
+which a flow can enforce with one gadget node per group. The conflicts
+between sections of different groups (a Wednesday that runs late into the
+next slot, say) are few and are returned as pairs, for the models to enforce
+separately. The groups and pairs follow the catalog instead of a
+hand-written tuple.
+"""
+import re
+
+DAYS = {'M': 0, 'Tu': 1, 'W': 2, 'Th': 3, 'F': 4, 'Sa': 5, 'Su': 6}
+MINUTES_PER_DAY = 24 * 60
+
+MEETING_RE = re.compile(r'(M|Tu|W|Th|F|Sa|Su)\s+(\d{4})-(\d{4})\s+(AM|PM)')
+
+def _minutes(hhmm, meridiem):
+    hours, minutes = int(hhmm[:2]), int(hhmm[2:])
+    if hours > 12 or minutes > 59:
+        raise ValueError('bad time: {0}'.format(hhmm))
+    return ((hours % 12) + (12 if meridiem == 'PM' else 0)) * 60 + minutes
+
+def parse_slot(slot):
+    """
+    Returns the sorted weekly (start, end) minute intervals of a time slot.
+    The AM/PM applies to the end time; a start that would come after the end
+    is taken 12 hours earlier, as in '1100-1230 PM'.
+    """
+    meetings = MEETING_RE.findall(slot)
+    if not meetings or MEETING_RE.sub('', slot).strip():
+        raise ValueError('unknown time slot format: {0}'.format(slot))
+    intervals = []
+    for day, start, end, meridiem in meetings:
+        end = _minutes(end, meridiem)
+        start = _minutes(start, meridiem)
+        if start > end:
+            start -= 12 * 60
+        if start >= end or start < 0:
+            raise ValueError('bad meeting time in {0}'.format(slot))
+        offset = DAYS[day] * MINUTES_PER_DAY
+        intervals.append((offset + start, offset + end))
+    return sorted(intervals)
+
+class IntervalIndex:
+    """
+    Weekly meeting intervals of a set of keys (sections or time slots).
+    times maps each key to a time slot string or a list of intervals.
+    Intervals are half-open, so back to back meetings do not conflict.
+    """
+
+    def __init__(self, times):
+        self.meetings = {}
+        self.intervals = []
+        for key, t in times.items():
+            meetings = parse_slot(t) if isinstance(t, basestring) else sorted(t)
+            self.meetings[key] = tuple(meetings)
+            for start, end in meetings:
+                self.intervals.append((start, end, key))
+        self.intervals.sort()
+        self.keys = sorted(times)
+        self.graph = self._sweep()
+
+    def _sweep(self):
+        """
+        Returns the conflict graph, as the set of keys each key conflicts
+        with.
+        """
+        graph = dict((key, set()) for key in self.keys)
+        events = sorted([(s, 1, key) for s, _, key in self.intervals] +
+                        [(e, 0, key) for _, e, key in self.intervals])
+        active = {}
+        for _, starts, key in events:
+            if starts:
+                for other in active:
+                    if other != key:
+                        graph[key].add(other)
+                        graph[other].add(key)
+                active[key] = active.get(key, 0) + 1
+            else:
+                active[key] -= 1
+                if not active[key]:
+                    del active[key]
+        return graph
+
+    def conflicts(self, key):
+        """
+        Returns the keys that meet at the same time as key.
+        """
+        return self.graph[key]
+
+    def groups(self):
+        """
+        Returns the groups of two or more keys with the same meeting times,
+        as sorted tuples in the order of their first keys. Every key of a
+        group conflicts with the others, and no key is in two groups.
+        """
+        groups = {}
+        for key in self.keys:
+            groups.setdefault(self.meetings[key], []).append(key)
+        return sorted(tuple(g) for g in groups.values() if len(g) > 1)
+
+    def pairs(self):
+        """
+        Returns the sorted conflicting pairs of keys with different meeting
+        times, the conflicts that groups leaves out.
+        """
+        return [(a, b) for a in self.keys for b in sorted(self.graph[a])
+                if a < b and self.meetings[a] != self.meetings[b]]
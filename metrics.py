@@ -0,0 +1,115 @@
+"""
+Run metrics: per-phase wall and CPU time, model size, solver statistics and
+peak memory, emitted as one JSON record per run.
+
+Collection is off until start() is called, and phase() and record() do
+nothing while it is off, so the hooks cost nothing in normal runs. Phases may
+nest; each records its own inclusive time, so 'solve' includes 'build'.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# allocation sites kept from a tracemalloc snapshot
+TRACE_TOP = 10
+
+ACTIVE = None
+
+def _cpu():
+    t = os.times()
+    return t[0] + t[1]
+
+class Metrics:
+
+    def __init__(self, profile=None, trace_memory=False):
+        self.record = OrderedDict((('time', time.strftime('%Y-%m-%d %H:%M:%S')),
+                                   ('argv', sys.argv)))
+        self.phases = self.record['phases'] = OrderedDict()
+        self.profile_path = profile
+        self.profiler = None
+        self.tracing = False
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        if trace_memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                sys.stderr.write('metrics: tracemalloc needs Python 3, '
+                                 'memory tracing is off\n')
+            else:
+                tracemalloc.start()
+                self.tracing = True
+
+    def finish(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile_path)
+            self.record['profile'] = self.profile_path
+        if self.tracing:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            self.record['allocations'] = [
+                OrderedDict((('site', str(stat.traceback)),
+                             ('kb', stat.size // 1024)))
+                for stat in snapshot.statistics('lineno')[:TRACE_TOP]]
+            tracemalloc.stop()
+        self.record['peak_rss_kb'] = resource.getrusage(
+            resource.RUSAGE_SELF).ru_maxrss
+        return self.record
+
+def start(profile=None, trace_memory=False):
+    """
+    Starts collecting metrics for this run, optionally under cProfile (stats
+    dumped to the path profile) and tracemalloc.
+    """
+    global ACTIVE
+    ACTIVE = Metrics(profile, trace_memory)
+
+@contextmanager
+def phase(name):
+    """
+    Times the enclosed block as the phase name, adding up repeated phases.
+    """
+    if ACTIVE is None:
+        yield
+        return
+    wall, cpu = time.time(), _cpu()
+    try:
+        yield
+    finally:
+        entry = ACTIVE.phases.setdefault(name, OrderedDict((('wall', 0.0),
+                                                           ('cpu', 0.0))))
+        entry['wall'] += time.time() - wall
+        entry['cpu'] += _cpu() - cpu
+
+def record(section, **values):
+    """
+    Adds values to the named section of the run's record.
+    """
+    if ACTIVE is not None:
+        ACTIVE.record.setdefault(section, OrderedDict()).update(values)
+
+def emit(path):
+    """
+    Finishes the run and appends its record as one line of JSON to path, or
+    writes it to stdout for '-'. Without a path the record is dropped.
+    """
+    global ACTIVE
+    if ACTIVE is None:
+        return
+    # numpy scalars turn into their python values
+    line = json.dumps(ACTIVE.finish(), default=lambda o: o.item()) + '\n'
+    ACTIVE = None
+    if path is None:
+        return
+    elif path == '-':
+        sys.stdout.write(line)
+    else:
+        with open(path, 'a') as f:
+            f.write(line)
@@ -0,0 +1,130 @@
+"""
+The term setup in one run: TAs first, then students in the staffed sections.
+
+Stage one assigns the TAs with assign_tas and writes their sections to
+TA_CSV. Stage two rebuilds assign_students.SECTIONS from the sections that
+got a TA, keeping each time slot of SECTIONS_TUP with its staffed sections
+and dropping slots with none, and assigns the students to that catalog.
+Preferences for dropped times are skipped, as fix.py did by hand.
+
+Each stage solves through the solution cache (see cache) under a key of its
+own inputs: the TAs' rankings and settings for stage one, and the students'
+rankings, the staffed catalog and the student settings for stage two. So
+new student preferences do not re-solve the TAs, and new TA preferences
+re-solve the students only if the staffed sections change.
+
+Each stage first clears the files it writes from the output directory, so a
+section that lost its TA or its students since the last run leaves no stale
+csv behind. Other files in the directory are left alone.
+"""
+import csv
+import os
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+import assign_students
+import assign_tas
+import backends
+import cache
+import metrics
+
+OUT_DIR = '.'
+TA_CSV = 'tas.csv'
+
+def staffed_catalog(staffed, slots=None):
+    """
+    Returns the SECTIONS mapping of the time slots of slots (SECTIONS_TUP by
+    default) restricted to the sections in staffed.
+    """
+    catalog = OrderedDict()
+    for slot, sects in slots or assign_students.SECTIONS_TUP:
+        kept = tuple(s for s in sects if s in staffed)
+        if kept:
+            catalog[slot] = kept
+    return catalog
+
+def clear_outputs(out_dir, names):
+    """
+    Removes the files of names that exist in out_dir.
+    """
+    for name in names:
+        path = os.path.join(out_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+def student_outputs():
+    """
+    Returns the names of the files the student stage may write: a csv per
+    section of the full catalog and the list of unassigned students.
+    """
+    sections = set(assign_tas.SECTIONS)
+    for _, sects in assign_students.SECTIONS_TUP:
+        sections.update(sects)
+    return [str(s) + '.csv' for s in sorted(sections)] + \
+        [assign_students.UNASSIGNED_OUT]
+
+def write_tas(tas, path):
+    """
+    Writes one (name, email, section) row per section taught.
+    """
+    with open(path, 'wb') as f:
+        writer = csv.writer(f)
+        for ta in tas:
+            for section in sorted(ta.sections):
+                writer.writerow([ta.name, ta.email, section])
+
+def assign_tas_stage(csv_file, prioritize, backend, use_cache, out_dir):
+    """
+    Assigns the TAs and returns the set of staffed sections.
+    """
+    clear_outputs(out_dir, [TA_CSV])
+    with metrics.phase('tas'):
+        tas = assign_tas.import_tas(csv_file, prioritize)
+        assign_tas.assign_sections(tas, prioritize, backend=backend,
+                                   use_cache=use_cache)
+    write_tas(tas, os.path.join(out_dir, TA_CSV))
+    return set(s for ta in tas for s in ta.sections)
+
+def main(ta_csv, student_csv, prioritize_tas=False, prioritize=False,
+         backend='auto', use_cache=True, invalidate=False, out_dir=OUT_DIR,
+         section_cap=None):
+    if invalidate:
+        cache.invalidate()
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    staffed = assign_tas_stage(ta_csv, prioritize_tas, backend, use_cache,
+                               out_dir)
+    catalog = staffed_catalog(staffed)
+    print 'staffed {0} of {1} sections in {2} time slots'.format(
+        len(staffed), len(assign_tas.SECTIONS), len(catalog))
+    a = assign_students
+    a.SECTIONS = catalog
+    a.IGNORE_UNKNOWN_TIMES = True
+    if section_cap is not None:
+        a.SECTION_CAP = section_cap
+    clear_outputs(out_dir, student_outputs())
+    with metrics.phase('students'):
+        a.main(student_csv, prioritize, False, False, backend,
+               use_cache=use_cache, out_dir=out_dir)
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='assigns TAs, then students to the sections that got a TA')
+    parser.add_argument('--prioritize-tas', action='store_true', help='give TAs with seniority priority')
+    parser.add_argument('-p', '--prioritize', action='store_true', help='give students with seniority priority')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend, picked by model size by default')
+    parser.add_argument('-c', '--section-cap', type=int, help='student capacity of each section (default: %d)' % assign_students.SECTION_CAP)
+    parser.add_argument('-o', '--out', default=OUT_DIR, help='directory for %s and the section csvs (default: %%(default)s)' % TA_CSV)
+    parser.add_argument('--no-cache', dest='use_cache', action='store_false', help='always build and solve both models')
+    parser.add_argument('--invalidate-cache', action='store_true', help='drop all cached solutions first')
+    parser.add_argument('--metrics', nargs='?', const=assign_students.METRICS_OUT, metavar='PATH', help="append the run's timings as a JSON line to PATH, - for stdout (default: %(const)s)")
+    parser.add_argument('ta_csv', help='csv file with the TAs\' section rankings')
+    parser.add_argument('student_csv', help='csv file with the students\' section time rankings')
+    args = parser.parse_args()
+    if args.metrics:
+        metrics.start()
+    try:
+        main(args.ta_csv, args.student_csv, args.prioritize_tas,
+             args.prioritize, args.backend, args.use_cache,
+             args.invalidate_cache, args.out, args.section_cap)
+    finally:
+        metrics.emit(args.metrics)
@@ -0,0 +1,120 @@
+"""
+Exact lexicographic objectives for the student models.
+
+The (rank+1)**RANK_EXPONENT weights stand in for "as many first choices as
+possible, then as many second choices, ...", but whether a given exponent
+gets there depends on the cohort's size. The costs here are exact instead.
+With B one more than the number of placements, no count of placements at
+later rank levels adds up to B**l, so
+
+    rank-maximal: a placement at level l costs B**(K-1) - B**(K-1-l), which
+                  maximizes the first choices, then the second, ...
+    minimax:      a placement at level l costs B**l, which minimizes the
+                  placements at the worst rank, then at the next worst, ...
+
+The costs are python integers, which flow.min_cost_assignment adds and
+compares exactly however large they grow, and its running time does not
+depend on them, so there is no coefficient range to tune.
+
+For minimax the worst rank needed is found first, by binary search over the
+rank levels. Whether everyone fits at or above a level is a max-flow
+question; with one section per row and few sections it is answered by
+checking Hall's condition over every set of sections at once, otherwise by
+a 0/1 cost flow. Levels past the worst one all cost the same, so B is raised
+only to that level's power.
+"""
+import numpy as np
+
+import flow
+
+MODES = ('rank-maximal', 'minimax')
+# Hall's condition is checked over all 2**M sets of sections up to this M
+HALL_MAX_SECTIONS = 20
+
+def rank_levels(ranks):
+    """
+    Returns the distinct ranks of the N x M array ranks in increasing order
+    and the level of every entry, its index among them.
+    """
+    values, levels = np.unique(ranks, return_inverse=True)
+    return values, levels.reshape(np.shape(ranks))
+
+def subset_sums(values):
+    """
+    Returns the array over all bitmasks T of the sum of values[S] over the
+    masks S contained in T, in O(M 2**M).
+    """
+    sums = np.array(values, dtype=np.int64)
+    M = len(sums).bit_length() - 1
+    for b in range(M):
+        view = sums.reshape(-1, 2, 1 << b)
+        view[:, 1, :] += view[:, 0, :]
+    return sums
+
+def hall_fits(allowed, caps):
+    """
+    Returns whether every row can get one of its allowed sections, by Hall's
+    condition: no set of sections may have more rows allowed only into it
+    than it has places.
+    """
+    M = len(caps)
+    masks = allowed.astype(np.int64).dot(1 << np.arange(M, dtype=np.int64))
+    need = subset_sums(np.bincount(masks, minlength=1 << M))
+    singles = np.zeros(1 << M, dtype=np.int64)
+    singles[1 << np.arange(M)] = caps
+    return bool((need <= subset_sums(singles)).all())
+
+def fits(levels, caps, demands, worst):
+    """
+    Returns whether every row can be placed at levels up to worst.
+    """
+    allowed = levels <= worst
+    if len(caps) <= HALL_MAX_SECTIONS and all(d == 1 for d in demands):
+        return hall_fits(allowed, caps)
+    costs = (~allowed).astype(np.int64).tolist()
+    _, misses = flow.min_cost_assignment(costs, caps, demands)
+    return misses == 0
+
+def worst_level(levels, caps, demands):
+    """
+    Returns the lowest level at which every row can be placed.
+    """
+    lo, hi = 0, int(levels.max())
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if fits(levels, caps, demands, mid):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+def level_costs(levels, base, mode, worst=None):
+    """
+    Returns the cost of each level, see the module docstring.
+    """
+    K = int(levels.max()) + 1
+    if mode == 'rank-maximal':
+        return [base**(K-1) - base**(K-1-l) for l in range(K)]
+    return [base**min(l, worst + 1) for l in range(K)]
+
+def solve(ranks, caps, demands, mode):
+    """
+    ranks: N x M array, ranks[j, i] is row j's rank of section i, lower is
+    better
+    caps: the capacity of each section
+    demands: the number of sections each row needs
+    mode: one of MODES
+    Returns the assignment as flow.min_cost_assignment does. Raises
+    ValueError if no feasible assignment exists.
+    """
+    if mode not in MODES:
+        raise ValueError('unknown objective: {0}'.format(mode))
+    _, levels = rank_levels(ranks)
+    if sum(demands) > sum(caps):
+        raise ValueError('no feasible assignment: {0} places for {1} '
+                         'placements'.format(sum(caps), sum(demands)))
+    worst = worst_level(levels, caps, demands) if mode == 'minimax' else None
+    weights = level_costs(levels, sum(demands) + 1, mode, worst)
+    costs = [[weights[l] for l in row] for row in levels.tolist()]
+    assignment, _ = flow.min_cost_assignment(costs, caps, demands)
+    return assignment
@@ -0,0 +1,310 @@
+"""
+Local assignment service for previews while the sign-up form is open.
+
+The service keeps the section catalog, the parsed preferences and the last
+solution in memory and answers over HTTP on localhost with JSON:
+
+    GET  /assignment              every student's section and rank
+    GET  /student?email=E         one student's section and rank
+    GET  /status                  versions, last solve status and timings
+    POST /submit {"name", "email", "sid", "prefs": [slot, ...],
+                  "priority"}     add or replace a submission
+    POST /drop {"email"}          withdraw a student
+    POST /cap {"section", "cap"}  change a section's capacity
+    POST /close {"sections"}      close sections
+    POST /reopen {"sections"}     reopen closed sections
+
+Changes only bump a version and return at once. A background worker
+re-solves when the state has changed, waiting COALESCE_SECONDS first so a
+burst of submissions costs one solve, and charges the churn penalty for
+moving students from the last solution so previews stay stable.
+
+The status of the last solve is the solver's own. When a solve fails, the
+assignment of the last successful one is still served, but marked stale,
+with the version it was computed from, until a solve succeeds again.
+"""
+import json
+import sys
+import threading
+import time
+import traceback
+import urlparse
+from argparse import ArgumentParser
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import OrderedDict
+from SocketServer import ThreadingMixIn
+
+import numpy as np
+
+import assign_students
+import backends
+
+HOST = '127.0.0.1'
+PORT = 8808
+COALESCE_SECONDS = 0.5
+
+class State:
+    """
+    The submissions, the catalog changes and the last solution, guarded by
+    one lock. version counts changes, solved is the version the last solve
+    ran on and assigned the version the assignment was computed from, which
+    is behind solved after a failed solve.
+    """
+
+    def __init__(self, prioritize=False, backend='auto'):
+        self.prioritize = prioritize
+        self.backend = backend
+        self.students = OrderedDict()
+        self.columns = dict((s, i) for i, s in
+                            enumerate(assign_students.SECTIONS))
+        # the catalog as loaded; closures and caps are applied to copies
+        self.catalog = OrderedDict(assign_students.SECTIONS)
+        self.base_caps = dict(assign_students.SECTION_CAPS)
+        self.sections = set(s for sects in self.catalog.values()
+                            for s in sects)
+        self.caps = {}
+        self.closed = set()
+        self.assignment = {}
+        self.version = 0
+        self.solved = 0
+        self.assigned = 0
+        self.last = OrderedDict()
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def load(self, csv_file):
+        cohort = assign_students.import_students(csv_file, self.prioritize)
+        with self.lock:
+            for j in range(len(cohort)):
+                self.students[cohort.emails[j]] = (
+                    cohort.names[j], int(cohort.sids[j]),
+                    cohort.rankings[j], int(cohort.priorities[j]))
+            self._bump()
+
+    def _bump(self):
+        self.version += 1
+        self.changed.notify()
+
+    def submit(self, name, email, sid, prefs, priority=0):
+        rankings = np.array(assign_students.convert_to_rankings(
+            prefs, self.columns), dtype=np.int16)
+        email = assign_students.fix_email(email)
+        with self.lock:
+            self.students[email] = (name, int(sid), rankings, int(priority))
+            self._bump()
+
+    def drop(self, email):
+        email = assign_students.fix_email(email)
+        with self.lock:
+            if self.students.pop(email, None) is None:
+                raise ValueError('no submission from {0}'.format(email))
+            self._bump()
+
+    def _check(self, section):
+        if section not in self.sections:
+            raise ValueError('unknown section: {0}'.format(section))
+
+    def set_cap(self, section, cap):
+        self._check(section)
+        with self.lock:
+            self.caps[section] = int(cap)
+            self._bump()
+
+    def close(self, sections):
+        for section in sections:
+            self._check(section)
+        with self.lock:
+            self.closed.update(sections)
+            self._bump()
+
+    def reopen(self, sections):
+        for section in sections:
+            self._check(section)
+        with self.lock:
+            for section in sections:
+                if section not in self.closed:
+                    raise ValueError('section {0} is not closed'.format(
+                        section))
+            self.closed.difference_update(sections)
+            self._bump()
+
+    def snapshot(self):
+        """
+        Returns the current version, a Cohort of the submissions and each
+        student's section in the last solution. Only the worker calls this,
+        so only the worker touches assign_students' catalog, which it sets
+        to the loaded catalog with the current closures and caps.
+        """
+        a = assign_students
+        a.SECTIONS = OrderedDict(self.catalog)
+        a.close_sections(self.closed)
+        a.SECTION_CAPS = dict(self.base_caps)
+        a.SECTION_CAPS.update(self.caps)
+        emails = list(self.students)
+        names, sids, rankings, priorities = zip(*self.students.values()) \
+            if emails else ((), (), (), ())
+        M = len(self.columns)
+        cohort = assign_students.Cohort(
+            list(names), emails, np.array(sids, dtype=np.int_),
+            np.array(rankings, dtype=np.int16).reshape(len(emails), M),
+            np.array(priorities, dtype=np.int_),
+            np.repeat(assign_students.SECTS_PER_STUD, len(emails)))
+        prior = np.array([self.assignment.get(e, (-1, None))[0]
+                          for e in emails], dtype=np.int64)
+        return self.version, cohort, prior
+
+    def solve(self):
+        """
+        Re-solves the current state and publishes the assignment.
+        """
+        with self.lock:
+            version, cohort, prior = self.snapshot()
+        start = time.time()
+        last = OrderedDict((('version', version),))
+        try:
+            status = backends.OPTIMAL # nobody to place
+            if len(cohort):
+                result = assign_students.assign_sections(
+                    cohort, self.prioritize, backend=self.backend,
+                    prior=prior if (prior >= 0).any() else None,
+                    use_cache=False)
+                status = result.status
+                last['backend'] = result.backend
+                if result.objective is not None:
+                    last['objective'] = float(result.objective)
+            assignment = {}
+            for j, email in enumerate(cohort.emails):
+                section = next(iter(cohort.sections[j]))
+                slot = next(i for i, sects in
+                            enumerate(assign_students.SECTIONS.values())
+                            if section in sects)
+                assignment[email] = (section, int(cohort.rankings[j, slot]))
+            last['status'] = status
+        except Exception as e:
+            traceback.print_exc()
+            assignment = None
+            last['status'] = backends.ERROR
+            last['error'] = str(e)
+        last['solve_seconds'] = round(time.time() - start, 3)
+        with self.lock:
+            if assignment is not None:
+                self.assignment = assignment
+                self.assigned = version
+            self.solved = version
+            self.last = last
+
+    def run(self):
+        """
+        The background worker: waits for changes, lets a burst of them
+        settle, then re-solves.
+        """
+        while True:
+            with self.lock:
+                while self.solved == self.version:
+                    self.changed.wait()
+            time.sleep(COALESCE_SECONDS)
+            self.solve()
+
+    def placement(self, email):
+        section, rank = self.assignment.get(email, (None, None))
+        if rank is not None:
+            rank = rank + 1 if rank != assign_students.DEFAULT_RANK \
+                else 'unranked'
+        return OrderedDict((('section', section), ('rank', rank)))
+
+    def status(self):
+        return OrderedDict((('version', self.version),
+                            ('solved', self.solved),
+                            ('pending', self.solved != self.version),
+                            ('assigned', self.assigned),
+                            ('stale', self.assigned != self.solved),
+                            ('closed', sorted(self.closed)),
+                            ('students', len(self.students)),
+                            ('last', self.last)))
+
+class Handler(BaseHTTPRequestHandler):
+
+    def _reply(self, code, body):
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        with state.lock:
+            if url.path == '/assignment':
+                body = state.status()
+                body['students'] = OrderedDict(
+                    (email, state.placement(email))
+                    for email in state.students)
+            elif url.path == '/student' and 'email' in query:
+                email = assign_students.fix_email(query['email'][0])
+                if email not in state.students:
+                    return self._reply(404, {'error': 'no submission from '
+                                             '{0}'.format(email)})
+                body = state.placement(email)
+                body['pending'] = state.solved != state.version
+                body['stale'] = state.assigned != state.solved
+            elif url.path == '/status':
+                body = state.status()
+            else:
+                return self._reply(404, {'error': 'not found'})
+        self._reply(200, body)
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.getheader('content-length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or '{}')
+            if self.path == '/submit':
+                state.submit(body['name'], body['email'], body['sid'],
+                             body['prefs'], body.get('priority', 0))
+            elif self.path == '/drop':
+                state.drop(body['email'])
+            elif self.path == '/cap':
+                state.set_cap(int(body['section']), body['cap'])
+            elif self.path == '/close':
+                state.close(body['sections'])
+            elif self.path == '/reopen':
+                state.reopen(body['sections'])
+            else:
+                return self._reply(404, {'error': 'not found'})
+        except (KeyError, TypeError, ValueError) as e:
+            return self._reply(400, {'error': str(e)})
+        self._reply(202, {'version': state.version})
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def main(csv_file, prioritize, backend, host, port):
+    state = State(prioritize, backend)
+    if csv_file:
+        state.load(csv_file)
+    worker = threading.Thread(target=state.run)
+    worker.daemon = True
+    worker.start()
+    server = Server((host, port), Handler)
+    server.state = state
+    sys.stderr.write('serving on http://{0}:{1}\n'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='serves live section assignment previews')
+    parser.add_argument('-p', '--prioritize', action='store_true', help='give students with seniority priority')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend')
+    parser.add_argument('--host', default=HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    parser.add_argument('csv_file', nargs='?', help='csv file with the submissions so far')
+    args = parser.parse_args()
+    main(args.csv_file, args.prioritize, args.backend, args.host, args.port)
@@ -0,0 +1,87 @@
+"""
+Sparse constraint matrices and the glue to hand them to lpsolve.
+
+The assignment models have one column per (student, section) pair, but every
+constraint row only touches a handful of those columns. Storing the rows in
+compressed sparse row form keeps model construction O(nonzeros) instead of
+O(rows * columns).
+"""
+from array import array
+
+# lpsolve constraint types
+LE = 1
+GE = 2
+EQ = 3
+# lpsolve verbosity level used by lp_maker
+IMPORTANT = 3
+
+class SparseMatrix:
+    """
+    A row-wise (CSR) sparse matrix. Row i is made up of the column indices
+    indices[indptr[i]:indptr[i+1]] with the matching values in data.
+    """
+
+    def __init__(self, ncols):
+        self.ncols = ncols
+        self.indptr = array('l', [0])
+        self.indices = array('l')
+        self.data = array('d')
+
+    def add_row(self, cols, vals=None):
+        """
+        Appends a row with nonzeros at cols. vals defaults to all ones.
+        """
+        cols = list(cols)
+        self.indices.extend(cols)
+        if vals is None:
+            self.data.extend(1.0 for _ in cols)
+        else:
+            self.data.extend(vals)
+        self.indptr.append(len(self.indices))
+
+    def row(self, i):
+        """
+        Returns the (cols, vals) pair of row i.
+        """
+        start, end = self.indptr[i], self.indptr[i+1]
+        return self.indices[start:end], self.data[start:end]
+
+    def rows(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def nnz(self):
+        return len(self.indices)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+def constr_type(e):
+    """
+    Maps an lp_maker style equality vector entry to an lpsolve constraint type.
+    """
+    if e < 0:
+        return LE
+    elif e == 0:
+        return EQ
+    return GE
+
+def lp_maker(f, A, b, e, vlb=None, vub=None):
+    """
+    Sparse counterpart of lp_maker.lp_maker. A is a SparseMatrix and rows are
+    added through add_constraintex, so the dense matrix is never built.
+    """
+    import lpsolve55 as lps
+    lp = lps.lpsolve('make_lp', 0, A.ncols)
+    lps.lpsolve('set_verbose', lp, IMPORTANT)
+    lps.lpsolve('set_obj_fn', lp, [float(c) for c in f])
+    lps.lpsolve('set_add_rowmode', lp, True)
+    for i, (cols, vals) in enumerate(A.rows()):
+        lps.lpsolve('add_constraintex', lp, list(vals), [c+1 for c in cols],
+                    constr_type(e[i]), float(b[i]))
+    lps.lpsolve('set_add_rowmode', lp, False)
+    if vlb is not None:
+        lps.lpsolve('set_lowbo', lp, vlb)
+    if vub is not None:
+        lps.lpsolve('set_upbo', lp, vub)
+    return lp
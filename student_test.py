@@ -1,46 +1,193 @@
-import random
-import string
-
-HEADER = 'Timestamp,What is your name?,What is your email?,What is your student ID number?,What is your top section time choice?,What is your second choice?,What is your third choice?,What is your fourth choice?,What is your fifth choice?'
-TIMES = ('M 0330-0500 PM W 0400-0530 PM',
-         'M 0500-0630 PM W 0500-0630 PM',
-         'M 0500-0630 PM W 0530-0700 PM',
-         'M 0630-0800 PM W 0630-0800 PM',
-         'M 0630-0800 PM W 0700-0830 PM',
-         'Tu 0930-100 AM Th 0930-100 AM',
-         'Tu 100-230 PM Th 100-230 PM',
-         'Tu 230-0200 PM Th 230-0200 PM',
-         'Tu 0200-0330 PM Th 0200-0330 PM',
-         'Tu 0330-0500 PM Th 0330-0500 PM',
-         'Tu 0500-0630 PM Th 0500-0630 PM',
-         'Tu 0630-0800 PM Th 0630-0800 PM',
-         'Tu 0800-0930 PM Th 0800-0930 PM',
-         'W 0830-000 AM F 0830-000 AM',
-         'W 0900-030 AM F 0930-100 AM',
-         'W 030-200 PM F 100-230 PM')
-INDICES = list(i for i in range(len(TIMES)))
-
-def random_name():
-    return ''.join(random.choice(string.ascii_letters)
-                   for _ in range(random.randint(5, 15)))
-
-def random_student():
-    random.shuffle(INDICES)
-    name = random_name()
-    return '{0},{1},{1}@berkeley.edu,{2},{3}'.format('8/8/2008 20:08:08',
-           name, random.randint(0, 99999999), ','.join(TIMES[i] for i in
-           INDICES[:5]))
-
-def main():
-    for _ in range(5):
-        temp = []
-        for _ in range(random.randint(1, 4)):
-            temp.append(random.choice(INDICES))
-        INDICES.extend(temp)
-    with open('student_test.csv', 'w') as f:
-        f.write(HEADER)
-        for _ in range(1000):
-            f.write('{}\n'.format(random_student()))
+"""
+Generates synthetic sign-up form exports for load-testing the importers and
+solvers.
+
+Rows are written in the layout of the real form exports, with the times (or,
+with --tas, the sections) of the catalogs in assign_students.py and
+assign_tas.py, so the output feeds straight into the real importers. Rows
+are generated in chunks and streamed, so millions of them take little
+memory.
+
+Preferences are drawn without replacement with per-student weights: each
+time slot has a Zipf-skewed popularity, and each student has a preferred
+hour of the day (see CHRONOTYPES) that slots close to it are favored by, so
+morning and evening people rank alike. Some students rank fewer than all
+choices, leaving the rest blank, and some submit again later with new
+preferences and one of their name, email or SID changed, as happens with
+real forms.
+"""
+import csv
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import assign_students
+import assign_tas
+import meeting_times
+
+OUT = 'student_test.csv'
+CHUNK = 10000
+# (preferred hour of day, share of the cohort)
+CHRONOTYPES = ((9.5, 0.3), (14.0, 0.3), (19.0, 0.4))
+SPREAD = 3.0 # hours off the preferred hour that cut a slot's weight by 1/e
+# (priority, share) of the students' seniority
+PRIORITIES = ((0, 0.5), (1, 0.25), (2, 0.15), (3, 0.1))
+# (number of sections, share) of the TAs
+TA_SECTIONS = ((2, 0.8), (1, 0.2))
+START = datetime(2008, 8, 8, 20, 8, 8)
+SECONDS_BETWEEN = 30 # mean seconds between two submissions
+FIRST_NAMES = ('Alex', 'Ana', 'Ben', 'Chen', 'Dana', 'Eli', 'Fatima', 'Grace',
+               'Hiro', 'Ines', 'Jamal', 'Kai', 'Lena', 'Mateo', 'Nadia',
+               'Omar', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq', 'Uma',
+               'Victor', 'Wei', 'Yara', 'Zoe')
+LAST_NAMES = ('Adams', 'Baker', 'Chavez', 'Diaz', 'Evans', 'Fischer',
+              'Garcia', 'Huang', 'Ito', 'Johnson', 'Kim', 'Lopez', 'Meyer',
+              'Nguyen', 'Okafor', 'Patel', 'Quist', 'Rossi', 'Singh',
+              'Tanaka', 'Ueda', 'Vargas', 'Wang', 'Xu', 'Yilmaz', 'Zhang')
+ORDINALS = ('top', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh',
+            'eighth', 'ninth', 'tenth')
+SID_BASE = 3030000000
+
+def catalog(tas=False):
+    """
+    Returns the choices of the form, as they appear in the export, and their
+    meeting times.
+    """
+    if tas:
+        sections = assign_tas.SECTIONS
+        times = [assign_tas.SECTION_TIMES[s] for s in sections]
+        labels = ['{0} ({1})'.format(s, t) for s, t in zip(sections, times)]
+        return labels, times
+    slots = list(assign_students.SECTIONS)
+    return slots, slots
+
+def start_hours(times):
+    """
+    Returns the hour of the day at which each time slot first meets.
+    """
+    return np.array([meeting_times.parse_slot(t)[0][0] %
+                     meeting_times.MINUTES_PER_DAY / 60.0 for t in times])
+
+def popularity(M, zipf, rand):
+    """
+    Returns Zipf weights 1/k**zipf over the M choices in a random order.
+    """
+    return (1.0 / np.arange(1, M + 1) ** zipf)[rand.permutation(M)]
+
+def draw(table, n, rand):
+    values, shares = zip(*table)
+    return np.array(values)[rand.choice(len(values), n, p=shares)]
+
+def sample(weights, k, rand):
+    """
+    Returns k choices per row of weights, without replacement and in order,
+    by the Efraimidis-Spirakis keys u**(1/w).
+    """
+    keys = np.log(rand.random_sample(weights.shape)) / weights
+    return np.argsort(-keys, axis=1)[:, :k]
+
+def person(p):
+    """
+    Returns the name, email and SID of person p.
+    """
+    first = FIRST_NAMES[p * 7 % len(FIRST_NAMES)]
+    last = LAST_NAMES[p // len(FIRST_NAMES) % len(LAST_NAMES)]
+    name = '{0} {1}'.format(first, last)
+    return name, 'student{0}@berkeley.edu'.format(p), SID_BASE + p
+
+def resubmitted(name, email, sid, variant):
+    """
+    Changes one of name, email and SID of a resubmission, or none.
+    """
+    if variant == 1:
+        name = name[:-1]
+    elif variant == 2:
+        email = email.replace('@berkeley.edu', '@gmail.com')
+    elif variant == 3:
+        sid += 1
+    return name, email, sid
+
+def header(choices, tas, priority):
+    row = ['Timestamp', 'What is your name?', 'What is your email?',
+           'What is your student ID number?']
+    row += ['What is your {0} {1} choice?'.format(
+        ORDINALS[i] if i < len(ORDINALS) else '#{0}'.format(i + 1),
+        'section' if tas else 'section time') for i in range(choices)]
+    if tas:
+        row.append('How many sections do you want to teach?')
+    if priority:
+        row.append('How many semesters have you taken the course?')
+    return row
+
+def generate(n, out, choices=5, tas=False, priority=False, zipf=1.0,
+             correlation=1.0, duplicates=0.0, partial=0.0, seed=0):
+    """
+    Writes a header and n rows of submissions as csv to the file out.
+    """
+    rand = np.random.RandomState(seed)
+    labels, times = catalog(tas)
+    M = len(labels)
+    if not 0 < choices <= M:
+        raise ValueError('choices must be between 1 and {0}'.format(M))
+    hours = start_hours(times)
+    base = popularity(M, zipf, rand)
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(header(choices, tas, priority))
+    people = 0
+    stamp = START
+    for lo in range(0, n, CHUNK):
+        B = min(CHUNK, n - lo)
+        prefer = draw(CHRONOTYPES, B, rand)
+        weights = base * np.exp(-correlation * ((hours - prefer[:, np.newaxis])
+                                                / SPREAD) ** 2)
+        picks = sample(weights, choices, rand)
+        ranked = np.where(rand.random_sample(B) < partial,
+                          rand.randint(1, max(choices, 2), B), choices)
+        again = rand.random_sample(B) < duplicates
+        variants = rand.randint(0, 4, B)
+        counts = draw(TA_SECTIONS, B, rand) if tas else None
+        levels = draw(PRIORITIES, B, rand) if priority else None
+        gaps = rand.exponential(SECONDS_BETWEEN, B)
+        for b in range(B):
+            if again[b] and people:
+                name, email, sid = resubmitted(
+                    *person(rand.randint(people)), variant=variants[b])
+            else:
+                name, email, sid = person(people)
+                people += 1
+            stamp += timedelta(seconds=gaps[b])
+            row = [stamp.strftime('%m/%d/%Y %H:%M:%S'), name, email, sid]
+            row += [labels[i] for i in picks[b, :ranked[b]]]
+            row += ['' for _ in range(choices - ranked[b])]
+            if tas:
+                row.append(counts[b])
+            if priority:
+                row.append(levels[b])
+            writer.writerow(row)
+
+def main(n, path, **options):
+    if path == '-':
+        generate(n, sys.stdout, **options)
+    else:
+        with open(path, 'w') as f:
+            generate(n, f, **options)
 
 if __name__ == '__main__':
-    main()
+    parser = ArgumentParser(description='generates synthetic sign-up form exports')
+    parser.add_argument('-n', '--rows', type=int, default=1000, help='number of rows')
+    parser.add_argument('-o', '--out', default=OUT, help='output csv, - for stdout (default: %(default)s)')
+    parser.add_argument('-c', '--choices', type=int, help='choices per row (default: 5, 8 with --tas)')
+    parser.add_argument('--tas', action='store_true', help='the TA layout: sections instead of times, plus the number of sections')
+    parser.add_argument('--priority', action='store_true', help='add a priority column')
+    parser.add_argument('--zipf', type=float, default=1.0, help='skew of the popularity of the choices, 0 for uniform')
+    parser.add_argument('--correlation', type=float, default=1.0, help='how strongly students favor choices near their preferred hour, 0 for not at all')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='fraction of rows that resubmit an earlier row')
+    parser.add_argument('--partial', type=float, default=0.0, help='fraction of rows that leave some choices blank')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    main(args.rows, args.out, choices=args.choices or (8 if args.tas else 5),
+         tas=args.tas, priority=args.priority, zipf=args.zipf,
+         correlation=args.correlation, duplicates=args.duplicates,
+         partial=args.partial, seed=args.seed)
@@ -0,0 +1,134 @@
+"""
+What-if sweeps over objective and capacity settings for assign_students.py.
+
+The export is parsed once. Each scenario in the grid (rank exponent,
+priority weighting, SECTION_CAP, DEFAULT_RANK) is then solved in a process
+pool whose workers inherit the parsed cohort read-only through fork. The
+results are compared in one table of rank histograms, worst rank, students
+placed in a time slot they did not rank, and solve time.
+"""
+import csv
+import itertools
+import multiprocessing
+import sys
+import time
+from argparse import ArgumentParser
+from collections import OrderedDict
+
+import numpy as np
+
+import assign_students
+import backends
+
+SWEEP_OUT = 'sweep.csv'
+# the parsed cohort, shared with the pool's workers by fork
+_COHORT = None
+
+def make_grid(exponents, prioritize, caps, default_ranks):
+    """
+    Returns the scenarios of the grid. The rank exponent only applies to the
+    unprioritized objective, so prioritized scenarios ignore it.
+    """
+    grid = []
+    for exponent, prio, cap, default in itertools.product(
+            exponents, (False, True) if prioritize else (False,), caps,
+            default_ranks):
+        scenario = OrderedDict((('exponent', None if prio else exponent),
+                                ('prioritize', prio), ('cap', cap),
+                                ('default_rank', default)))
+        if scenario not in grid:
+            grid.append(scenario)
+    return grid
+
+def run_scenario(scenario, backend='auto'):
+    """
+    Solves one scenario against the shared cohort and returns its row of the
+    comparison table.
+    """
+    a = assign_students
+    students = _COHORT
+    M = students.rankings.shape[1]
+    N = len(students)
+    rankings = students.rankings
+    unranked = rankings == a.DEFAULT_RANK
+    a.SECTION_CAP = scenario['cap']
+    if scenario['exponent'] is not None:
+        a.RANK_EXPONENT = scenario['exponent']
+    view = a.Cohort(students.names, students.emails, students.sids,
+                    np.where(unranked, scenario['default_rank'], rankings),
+                    students.priorities, students.num_sections)
+    row = OrderedDict(scenario)
+    start = time.time()
+    f = a.make_obj_f(view, scenario['prioritize'])
+    network = None
+    if a.is_network():
+        network = lambda: a.solve_flow(f, view, M)
+    model = backends.Model(f, lambda: (a.make_coeff_m(M, N),
+                                       a.make_b_v(view, M, N),
+                                       a.make_e_v(M, N)),
+                           [1 for _ in range(M*N)], network=network)
+    name = backends.choose(model) if backend == 'auto' else backend
+    result = backends.BACKENDS[name](model)
+    row['status'] = result.status
+    row['objective'] = result.objective
+    if result.x is not None:
+        rows, cols = np.nonzero(
+            np.asarray(result.x, dtype=float).reshape(N, M) > 0.5)
+        ranked = ~unranked[rows, cols]
+        ranks = rankings[rows, cols][ranked].astype(np.int64) + 1
+        hist = np.bincount(ranks, minlength=a.DEFAULT_RANK + 1)
+        for rank in range(1, len(hist)):
+            row['rank {0}'.format(rank)] = hist[rank]
+        row['unranked'] = (~ranked).sum()
+        row['worst'] = 'unranked' if row['unranked'] else ranks.max()
+    row['solve_time'] = round(time.time() - start, 3)
+    return row
+
+def _run(args):
+    return run_scenario(*args)
+
+def write_table(rows, path):
+    header = []
+    for row in rows:
+        header.extend(k for k in row if k not in header)
+    with open(path, 'wb') as f:
+        csvwriter = csv.writer(f)
+        csvwriter.writerow(header)
+        for row in rows:
+            csvwriter.writerow([row.get(k, '') for k in header])
+    widths = [max(len(str(k)), max(len(str(r.get(k, ''))) for r in rows))
+              for k in header]
+    print '  '.join(str(k).rjust(w) for k, w in zip(header, widths))
+    for row in rows:
+        print '  '.join(str(row.get(k, '')).rjust(w)
+                        for k, w in zip(header, widths))
+
+def main(csv_file, exponents, prioritize, caps, default_ranks, backend,
+         processes, out):
+    global _COHORT
+    _COHORT = assign_students.import_students(csv_file, prioritize)
+    grid = make_grid(exponents, prioritize, caps, default_ranks)
+    start = time.time()
+    pool = multiprocessing.Pool(processes)
+    try:
+        rows = pool.map(_run, [(scenario, backend) for scenario in grid])
+    finally:
+        pool.close()
+        pool.join()
+    write_table(rows, out)
+    sys.stderr.write('sweep: {0} scenarios in {1:.2f}s\n'.format(
+        len(grid), time.time() - start))
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='compares section assignments across settings')
+    parser.add_argument('-e', '--exponent', type=int, nargs='+', default=[assign_students.RANK_EXPONENT], help='rank exponents of the objective')
+    parser.add_argument('-p', '--prioritize', action='store_true', help='the export has a priority column; also sweep the prioritized objective')
+    parser.add_argument('-c', '--cap', type=int, nargs='+', default=[assign_students.SECTION_CAP], help='section caps')
+    parser.add_argument('-d', '--default-rank', type=int, nargs='+', default=[assign_students.DEFAULT_RANK], help='ranks of unranked time slots')
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + sorted(backends.BACKENDS), help='solver backend')
+    parser.add_argument('-j', '--processes', type=int, help='worker processes, one per core by default')
+    parser.add_argument('-o', '--out', default=SWEEP_OUT, help='where to write the comparison table')
+    parser.add_argument('csv_file', help='csv file with section rankings')
+    args = parser.parse_args()
+    main(args.csv_file, args.exponent, args.prioritize, args.cap,
+         args.default_rank, args.backend, args.processes, args.out)
@@ -0,0 +1,59 @@
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+import anytime
+import assign_students
+
+class GreedyTest(unittest.TestCase):
+
+    def test_demand_two_needs_a_move(self):
+        # the first two students take A and B, the third finds only C free
+        costs = np.array([[1, 8, 27]] * 3)
+        x = anytime.greedy(costs, [2, 2, 2], [2, 2, 2])
+        self.assertEqual(x.sum(axis=1).tolist(), [2, 2, 2])
+        self.assertTrue((x.sum(axis=0) <= 2).all())
+
+    def test_groups_respected(self):
+        costs = np.array([[1, 8, 27, 64]] * 2)
+        x = anytime.greedy(costs, [1, 1, 2, 2], [2, 2], groups=((0, 1),))
+        self.assertEqual(x.sum(axis=1).tolist(), [2, 2])
+        self.assertTrue((x[:, :2].sum(axis=1) <= 1).all())
+
+    def test_infeasible(self):
+        costs = np.array([[1, 8]] * 3)
+        self.assertRaises(ValueError, anytime.greedy, costs, [2, 2],
+                          [2, 2, 2])
+
+class AnytimeAssignTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'SECTS_PER_STUD', 'SECTION_CAPS')
+
+    def setUp(self):
+        a = assign_students
+        self.saved = dict((k, getattr(a, k)) for k in self.SETTINGS)
+        a.SECTIONS = OrderedDict((('A', (1,)), ('B', (2,)), ('C', (3,))))
+        a.SECTION_CAP = 2
+        a.SECTS_PER_STUD = 2
+        a.SECTION_CAPS = {}
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+
+    def test_demand_two(self):
+        students = assign_students.Cohort(
+            ['a', 'b', 'c'], ['a@x.edu', 'b@x.edu', 'c@x.edu'],
+            np.array([1, 2, 3]), np.array([[0, 1, 2]] * 3, dtype=np.int8),
+            np.zeros(3, dtype=int), np.full(3, 2, dtype=int))
+        assign_students.assign_sections(students, use_cache=False, budget=2)
+        self.assertEqual([len(s) for s in students.sections], [2, 2, 2])
+        counts = {}
+        for sections in students.sections:
+            for s in sections:
+                counts[s] = counts.get(s, 0) + 1
+        self.assertEqual(counts, {1: 2, 2: 2, 3: 2})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from collections import OrderedDict
+from StringIO import StringIO
+
+import numpy as np
+
+import assign_students
+import backends
+import student_test
+
+def stub_backend(model):
+    """
+    Fills each group's demand from its cheapest slots with seats left, as a
+    stand-in for the MIP backends, which need solver libraries.
+    """
+    model.build()
+    M = len(assign_students.SECTIONS)
+    f = np.asarray(model.f).reshape(-1, M)
+    caps = np.array(model.b[:M])
+    demands = model.b[M:M+len(f)]
+    x = np.zeros(f.shape, dtype=int)
+    for g in range(len(f)):
+        left = demands[g]
+        for i in np.argsort(f[g], kind='mergesort'):
+            x[g, i] = min(left, caps[i], model.ub[g*M+i])
+            caps[i] -= x[g, i]
+            left -= x[g, i]
+    return backends.Result('stub', backends.OPTIMAL, x.ravel().tolist(),
+                           model.objective(x.ravel()))
+
+class ReproducibleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv = os.path.join(self.directory, 'students.csv')
+        with open(self.csv, 'w') as f:
+            student_test.generate(500, f, duplicates=0.1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def rosters(self, name, seed=0):
+        out = os.path.join(self.directory, name)
+        os.mkdir(out)
+        assign_students.main(self.csv, False, False, False, 'flow',
+                             use_cache=False, out_dir=out, seed=seed)
+        rosters = {}
+        for fn in os.listdir(out):
+            with open(os.path.join(out, fn)) as f:
+                rosters[fn] = f.read()
+        return rosters
+
+    def test_import_order(self):
+        a = assign_students.import_students(self.csv, seed=3)
+        b = assign_students.import_students(self.csv, seed=3)
+        self.assertEqual(a.emails, b.emails)
+
+    def test_same_rosters(self):
+        first = self.rosters('first')
+        self.assertTrue(first)
+        self.assertEqual(first, self.rosters('second'))
+
+class RelaxTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'SECTION_CAPS')
+
+    def setUp(self):
+        a = assign_students
+        self.saved = dict((k, getattr(a, k)) for k in self.SETTINGS)
+        a.SECTIONS = OrderedDict((('A', (1,)), ('B', (2,))))
+        a.SECTION_CAP = 2
+        a.SECTION_CAPS = {}
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+
+    def cohort(self, rankings, priorities=None):
+        N = len(rankings)
+        if priorities is None:
+            priorities = [0 for _ in rankings]
+        return assign_students.Cohort(
+            [str(j) for j in range(N)], ['{0}@x.edu'.format(j)
+                                         for j in range(N)],
+            np.arange(N), np.array(rankings, dtype=np.int8),
+            np.array(priorities), np.ones(N, dtype=int))
+
+    def left_out(self, students, prioritize=False, seed=0):
+        _, unassigned = assign_students.relax(students, prioritize, seed)
+        return sorted(unassigned.names)
+
+    def test_costliest_best_option_first(self):
+        D = assign_students.DEFAULT_RANK
+        # 3 and 4 ranked neither slot, so they are left out
+        students = self.cohort([[0, 1], [1, 0], [0, 1], [D, D], [D, D],
+                                [1, 0]])
+        self.assertEqual(self.left_out(students), ['3', '4'])
+
+    def test_priority(self):
+        students = self.cohort([[0, 1]] * 5, [2, 0, 2, 1, 2])
+        self.assertEqual(self.left_out(students, True), ['1'])
+
+    def test_seeded_ties(self):
+        runs = [self.left_out(self.cohort([[0, 1]] * 6), seed=seed)
+                for seed in (0, 0, 1, 2, 3)]
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual([len(run) for run in runs], [2] * 5)
+        self.assertTrue(len(set(map(tuple, runs))) > 1)
+
+class AggregateTest(unittest.TestCase):
+
+    def setUp(self):
+        backends.BACKENDS['stub'] = stub_backend
+        self.directory = tempfile.mkdtemp()
+        self.csv = os.path.join(self.directory, 'students.csv')
+        with open(self.csv, 'w') as f:
+            student_test.generate(50, f)
+
+    def tearDown(self):
+        del backends.BACKENDS['stub']
+        shutil.rmtree(self.directory)
+
+    def test_every_roster_written(self):
+        out = os.path.join(self.directory, 'out')
+        os.mkdir(out)
+        assign_students.main(self.csv, False, False, True, 'stub',
+                             use_cache=False, out_dir=out)
+        emails = []
+        for fn in os.listdir(out):
+            with open(os.path.join(out, fn)) as f:
+                emails += [line.rstrip('\r\n').split(',')[1] for line in f]
+        cohort = assign_students.import_students(self.csv)
+        self.assertEqual(sorted(emails), sorted(cohort.emails))
+
+class ExpandTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'SECTION_CAPS', 'SECTS_PER_STUD',
+                'CONCURR_SECTIONS')
+
+    def setUp(self):
+        a = assign_students
+        self.saved = dict((k, getattr(a, k)) for k in self.SETTINGS)
+        a.SECTIONS = OrderedDict((('A', (1,)), ('B', (2,)), ('C', (3,)),
+                                  ('D', (4,))))
+        a.SECTION_CAP = 3
+        a.SECTION_CAPS = {}
+        a.SECTS_PER_STUD = 2
+        # A and B meet at the same time
+        a.CONCURR_SECTIONS = ((0, 1),)
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+
+    def test_counts_and_concurrency(self):
+        N, M = 5, 4
+        students = assign_students.Cohort(
+            [str(j) for j in range(N)], ['{0}@x.edu'.format(j)
+                                         for j in range(N)],
+            np.arange(N), np.zeros((N, M), dtype=np.int8),
+            np.zeros(N, dtype=int), np.full(N, 2, dtype=int))
+        groups = [[0, 2, 4], [1, 3]]
+        # per group seats in A, B, C and D: A and B together never exceed
+        # the group size, nor any slot its cap of 3
+        res = [2, 1, 2, 1,
+               1, 1, 1, 1]
+        order = [j for group in groups for j in group]
+        x = np.array(assign_students.expand_results(res, groups, M))
+        taken = students.take(order)
+        assign_students.parse_results(x, taken, M)
+        self.assertEqual([len(s) for s in taken.sections], [2] * N)
+        for sections in taken.sections:
+            self.assertEqual(len(set(sections)), 2)
+            self.assertFalse(set([1, 2]) <= set(sections))
+        counts = x.reshape(N, M).sum(axis=0)
+        self.assertEqual(counts.tolist(), [3, 2, 3, 2])
+        self.assertTrue((counts <= assign_students.slot_caps()).all())
+
+class ChurnTest(unittest.TestCase):
+
+    def test_distinct_emails(self):
+        emails = ['a@x.edu', 'a@x.edu', 'b@x.edu', 'c@x.edu']
+        students = assign_students.Cohort(
+            ['A', 'A', 'B', 'C'], emails, np.arange(4),
+            np.zeros((4, 1), dtype=np.int8), np.zeros(4, dtype=int),
+            np.ones(4, dtype=int))
+        students.sections = [(1,), (1,), (1,), (2,)]
+        # e was pinned or filtered out of the run, d left the export
+        previous = {'a@x.edu': 1, 'b@x.edu': 2, 'd@x.edu': 3, 'e@x.edu': 1}
+        imported = set(emails + ['e@x.edu'])
+        saved, sys.stderr = sys.stderr, StringIO()
+        try:
+            assign_students.report_churn(students, previous, imported)
+            out = sys.stderr.getvalue()
+        finally:
+            sys.stderr = saved
+        self.assertEqual(out, 'incremental: 1 kept, 1 moved, 1 added, '
+                              '1 dropped\n')
+
+class PinTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'SECTION_CAPS')
+
+    def setUp(self):
+        a = assign_students
+        self.saved = dict((k, getattr(a, k)) for k in self.SETTINGS)
+        a.SECTIONS = OrderedDict((('M 0900-1000 AM', (1, 2)),
+                                  ('Tu 0900-1000 AM', (3,))))
+        a.SECTION_CAP = 10
+        a.SECTION_CAPS = {}
+        self.directory = tempfile.mkdtemp()
+        self.csv = os.path.join(self.directory, 'students.csv')
+        with open(self.csv, 'w') as f:
+            f.write('Timestamp,Name,Email,SID,First\n')
+            for j in range(7):
+                f.write('08/08/2008 20:08:0{0},S{0} L{0},s{0}@x.edu,{0},'
+                        'M 0900-1000 AM\n'.format(j))
+        # three of them already sit in section 1
+        self.pins = dict(('s{0}@x.edu'.format(j), (None, 1))
+                         for j in range(3))
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+        shutil.rmtree(self.directory)
+
+    def sizes(self, name):
+        out = os.path.join(self.directory, name)
+        os.mkdir(out)
+        assign_students.main(self.csv, False, False, False, 'flow',
+                             use_cache=False, out_dir=out, pins=self.pins)
+        sizes = {}
+        for fn in os.listdir(out):
+            with open(os.path.join(out, fn)) as f:
+                sizes[fn] = len(f.readlines())
+        return sizes
+
+    def test_pinned_sections_stay_even(self):
+        self.assertEqual(self.sizes('first'), {'1.csv': 4, '2.csv': 3})
+
+    def test_runs_do_not_add_up(self):
+        first = self.sizes('first')
+        self.assertEqual(assign_students.SECTION_CAPS, {})
+        self.assertEqual(self.sizes('second'), first)
+
+if __name__ == '__main__':
+    unittest.main()
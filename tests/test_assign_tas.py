@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import assign_tas
+import meeting_times
+
+class MeetingTimesTest(unittest.TestCase):
+
+    def test_groups_and_pairs(self):
+        index = meeting_times.IntervalIndex({
+            1: 'M 0330-0500 PM W 0400-0530 PM',
+            2: 'M 0330-0500 PM W 0400-0530 PM',
+            3: 'M 0500-0630 PM W 0500-0630 PM',
+            4: 'M 0630-0800 PM W 0630-0800 PM'})
+        self.assertEqual(index.groups(), [(1, 2)])
+        # 3 starts on Wednesday before 1 and 2 end, 4 meets back to back
+        self.assertEqual(index.pairs(), [(1, 3), (2, 3)])
+        self.assertEqual(index.conflicts(3), set([1, 2]))
+
+class FlowTest(unittest.TestCase):
+
+    def ta(self, name, favorites, num_sections=2):
+        rankings = [assign_tas.DEFAULT_RANK for _ in assign_tas.SECTIONS]
+        for rank, s in enumerate(favorites):
+            rankings[assign_tas.SECTIONS.index(s)] = rank
+        return assign_tas.TA(name, len(name), name + '@x.edu', rankings,
+                             num_sections)
+
+    def test_groups_are_disjoint(self):
+        self.assertTrue(assign_tas.is_network())
+
+    def test_conflicting_pair(self):
+        # 30 and 35 overlap on Wednesdays, as do 31 and 35, and 30 and 31
+        # meet at the same time, so the cheapest flow needs two branchings
+        tas = [self.ta('Ana Diaz', [30, 31, 35, 11])]
+        assign_tas.assign_sections(tas, backend='flow', use_cache=False)
+        self.assertEqual(tas[0].sections, set([30, 11]))
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv = os.path.join(self.directory, 'tas.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_email_normalized(self):
+        with open(self.csv, 'w') as f:
+            f.write('Timestamp,Name,Email,SID,First,Second,Sections\n')
+            f.write('08/08/2008 20:08:00,Ana Diaz,ana,1,30 M,11 Tu,2\n')
+            # same email and name once the domain is filled in
+            f.write('08/08/2008 20:08:05,Ana Diaz,ana@berkeley.edu,2,'
+                    '31 M,11 Tu,2\n')
+        tas = assign_tas.import_tas(self.csv)
+        self.assertEqual(len(tas), 1)
+        self.assertEqual(tas[0].email, 'ana@berkeley.edu')
+        self.assertEqual(tas[0].sid, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import assign_students
+import batch
+
+class ManifestTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'IGNORE_UNKNOWN_TIMES',
+                'CHURN_PENALTY')
+
+    def setUp(self):
+        self.saved = dict((k, getattr(assign_students, k))
+                          for k in self.SETTINGS)
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'a.csv'), 'w') as f:
+            f.write('Timestamp,Name,Email,SID,First,Second\n')
+            for j in range(4):
+                # the second choice is a time the catalog does not have
+                f.write('08/08/2008 20:08:0{0},S{0} L{0},s{0}@x.edu,{0},'
+                        'M 0900-1000 AM,F 0100-0200 PM\n'.format(j))
+        with open(os.path.join(self.directory, 'leave.csv'), 'w') as f:
+            f.write('s0@x.edu\n')
+        self.out = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+        shutil.rmtree(self.directory)
+
+    def manifest(self, courses, defaults=None):
+        path = os.path.join(self.directory, 'manifest.json')
+        with open(path, 'w') as f:
+            json.dump({'courses': courses, 'defaults': defaults or {}}, f)
+        return batch.load_manifest(path)
+
+    def course(self, **options):
+        course = {'name': 'a', 'csv': 'a.csv',
+                  'sections': [['M 0900-1000 AM', [1, 2]]],
+                  'section_cap': 2}
+        course.update(options)
+        return course
+
+    def test_unknown_key(self):
+        self.assertRaises(ValueError, self.manifest,
+                          [self.course(ignore_unknown_time=True)])
+        self.assertRaises(ValueError, self.manifest, [self.course()],
+                          {'sectoin_cap': 3})
+
+    def test_defaults_and_paths(self):
+        courses = self.manifest(
+            [self.course(), self.course(name='b', seed=5, exclude='leave.csv')],
+            {'seed': 2, 'relax': True})
+        self.assertEqual([c['seed'] for c in courses], [2, 5])
+        self.assertTrue(all(c['relax'] for c in courses))
+        self.assertEqual(courses[1]['exclude'],
+                         os.path.join(self.directory, 'leave.csv'))
+
+    def test_module_options(self):
+        course, = self.manifest([self.course()])
+        name, status, _, _ = batch.run_course(course, self.out, 'flow', False)
+        self.assertEqual(status, 'FAILED')
+        course, = self.manifest([self.course(exclude='leave.csv')],
+                                {'ignore_unknown_times': True})
+        name, status, _, out = batch.run_course(course, self.out, 'flow',
+                                                False)
+        self.assertEqual(status, 'OK')
+        placed = []
+        for fn in os.listdir(out):
+            with open(os.path.join(out, fn)) as f:
+                placed += [line for line in f]
+        self.assertEqual(len(placed), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import cache
+
+WRITERS = 4
+ENTRIES = 50
+
+def write_entries(args):
+    """
+    Stores ENTRIES entries into a cache that holds only a few, and returns
+    None or the error that store warned or evict raised about.
+    """
+    directory, writer = args
+    res = np.arange(2000) % 3 == 0
+    try:
+        for k in range(ENTRIES):
+            key = cache.model_key([res], (writer, k))
+            cache._write(key, res, k, 'OPTIMAL', directory)
+            cache.evict(directory, max_bytes=2000)
+            cache.load(key, directory)
+    except Exception as e:
+        return repr(e)
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        res = np.array([True, False, True])
+        key = cache.model_key([res], ('test',))
+        self.assertIsNone(cache.load(key, self.directory))
+        cache.store(key, res, 7, 'OPTIMAL', self.directory)
+        hit, objective, status = cache.load(key, self.directory)
+        self.assertEqual(hit.tolist(), [1, 0, 1])
+        self.assertEqual((objective, status), (7, 'OPTIMAL'))
+
+    def test_concurrent_writers(self):
+        pool = multiprocessing.Pool(WRITERS)
+        try:
+            errors = pool.map(write_entries, [(self.directory, w)
+                                              for w in range(WRITERS)])
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(errors, [None] * WRITERS)
+        left = os.listdir(self.directory)
+        self.assertFalse([fn for fn in left
+                          if fn.startswith(cache.TMP_PREFIX)])
+
+    def test_store_never_raises(self):
+        blocker = os.path.join(self.directory, 'file')
+        open(blocker, 'w').close()
+        # the cache directory cannot be created under a file
+        cache.store('key', np.zeros(3), 0, 'OPTIMAL',
+                    os.path.join(blocker, 'cache'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import time
+import unittest
+
+import dedupe
+
+STAMP = '08/08/2008 20:08:{0:02d}'
+
+def same_name(n):
+    """
+    Returns a Deduper fed n different people who all share one name.
+    """
+    d = dedupe.Deduper()
+    for k in range(n):
+        d.add('s{0}@berkeley.edu'.format(k), k, 'Sam Lee',
+              STAMP.format(k % 60), k)
+    return d
+
+class DeduperTest(unittest.TestCase):
+
+    def test_two_of_three(self):
+        d = dedupe.Deduper()
+        self.assertEqual(d.add('a@x.edu', 1, 'Ana Diaz', STAMP.format(0), 2),
+                         (0, True))
+        # new email, same SID and name: a resubmission
+        self.assertEqual(d.add('b@x.edu', 1, 'ana  diaz', STAMP.format(5), 3),
+                         (0, True))
+        # an older row of the same person loses
+        self.assertEqual(d.add('b@x.edu', 2, 'Ana Diaz', STAMP.format(1), 4),
+                         (0, False))
+        # one field in common is somebody else
+        self.assertEqual(d.add('c@x.edu', 1, 'Ben Kim', STAMP.format(6), 5),
+                         (1, True))
+        self.assertEqual([kept for kept, _, _ in d.merges], [3, 3])
+
+    def test_lowest_record_wins(self):
+        d = dedupe.Deduper()
+        d.add('a@x.edu', 1, 'Ana Diaz', STAMP.format(0), 2)
+        d.add('b@x.edu', 1, 'Ben Kim', STAMP.format(1), 3)
+        # matches record 0 by email and SID and record 1 by SID and name
+        self.assertEqual(d.add('a@x.edu', 1, 'Ben Kim', STAMP.format(2), 4),
+                         (0, True))
+        # record 0 now shares SID and name with record 1, both stay indexed
+        self.assertEqual(d.add('c@x.edu', 1, 'Ben Kim', STAMP.format(3), 5),
+                         (0, True))
+        self.assertEqual(d.add('b@x.edu', 9, 'Ben Kim', STAMP.format(4), 6),
+                         (1, True))
+
+    def test_superseded_rows_still_match(self):
+        d = dedupe.Deduper()
+        email = 'student38@berkeley.edu'
+        self.assertEqual(d.add(email, 3030000038, 'Fatima Baker',
+                               STAMP.format(0), 2), (0, True))
+        self.assertEqual(d.add(email, 3030000039, 'Fatima Baker',
+                               STAMP.format(1), 3), (0, True))
+        # matches the first row on email and SID, the latest on email only
+        self.assertEqual(d.add(email, 3030000038, 'Fatima Bake',
+                               STAMP.format(2), 4), (0, True))
+        self.assertEqual(len(d.lines), 1)
+        self.assertEqual(d.merges[-1], (4, 3, ('email', 'sid')))
+        # an older row of a superseded combination still loses
+        self.assertEqual(d.add('f@x.edu', 3030000039, 'fatima baker',
+                               STAMP.format(0), 5), (0, False))
+
+    def test_shared_name_stays_linear(self):
+        d = same_name(20000)
+        self.assertEqual(len(d.lines), 20000)
+        self.assertFalse(d.merges)
+        # no index entry grows with the number of people sharing a field
+        self.assertFalse([js for js in d.index.values()
+                          if not isinstance(js, int)])
+        times = []
+        for n in (5000, 50000):
+            start = time.time()
+            same_name(n)
+            times.append(time.time() - start)
+        # ten times the rows, 100 times the time if matching were quadratic
+        self.assertLess(times[1], 30 * times[0])
+
+    def test_hash_collisions(self):
+        d = dedupe.Deduper()
+        d._hashes = lambda keys: [(a, b, 0) for a, b in dedupe.PAIRS]
+        self.assertEqual(d.add('a@x.edu', 1, 'Ana Diaz', STAMP.format(0), 2),
+                         (0, True))
+        self.assertEqual(d.add('b@x.edu', 2, 'Ben Kim', STAMP.format(1), 3),
+                         (1, True))
+        self.assertEqual(d.add('b@x.edu', 2, 'Ben Lee', STAMP.format(2), 4),
+                         (1, True))
+        self.assertEqual(d.add('a@x.edu', 3, 'Ana Diaz', STAMP.format(3), 5),
+                         (0, True))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import assign_students
+import pipeline
+import student_test
+
+class PipelineTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'IGNORE_UNKNOWN_TIMES')
+
+    def setUp(self):
+        self.saved = dict((k, getattr(assign_students, k))
+                          for k in self.SETTINGS)
+        self.directory = tempfile.mkdtemp()
+        self.tas = os.path.join(self.directory, 'tas_in.csv')
+        self.students = os.path.join(self.directory, 'students_in.csv')
+        with open(self.tas, 'w') as f:
+            student_test.generate(15, f, choices=8, tas=True, seed=1)
+        with open(self.students, 'w') as f:
+            student_test.generate(300, f, seed=2)
+        self.out = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+        shutil.rmtree(self.directory)
+
+    def test_no_stale_outputs(self):
+        os.mkdir(self.out)
+        # every section has a csv from an earlier run, and a file of the
+        # user's that is not the pipeline's to remove
+        for name in pipeline.student_outputs() + ['notes.txt']:
+            open(os.path.join(self.out, name), 'w').close()
+        pipeline.main(self.tas, self.students, use_cache=False,
+                      out_dir=self.out)
+        with open(os.path.join(self.out, pipeline.TA_CSV), 'rb') as f:
+            staffed = set(line.rstrip('\r\n').split(',')[-1] for line in f)
+        left = set(os.listdir(self.out))
+        written = left - set([pipeline.TA_CSV, 'notes.txt'])
+        self.assertIn('notes.txt', left)
+        self.assertTrue(written)
+        # every section csv left is of a staffed section and not empty
+        for name in written:
+            self.assertIn(name[:-len('.csv')], staffed)
+            self.assertTrue(os.path.getsize(os.path.join(self.out, name)))
+
+if __name__ == '__main__':
+    unittest.main()
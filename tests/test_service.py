@@ -0,0 +1,63 @@
+import unittest
+from collections import OrderedDict
+
+import assign_students
+import backends
+import service
+
+class StateTest(unittest.TestCase):
+
+    SETTINGS = ('SECTIONS', 'SECTION_CAP', 'SECTION_CAPS', 'SECTS_PER_STUD')
+
+    def setUp(self):
+        a = assign_students
+        self.saved = dict((k, getattr(a, k)) for k in self.SETTINGS)
+        a.SECTIONS = OrderedDict((('M 0900-1000 AM', (1,)),
+                                  ('Tu 0900-1000 AM', (2, 3))))
+        a.SECTION_CAP = 2
+        a.SECTION_CAPS = {}
+        a.SECTS_PER_STUD = 1
+        self.state = service.State(backend='flow')
+        for j in range(3):
+            self.state.submit('S{0} L{0}'.format(j), 's{0}@x.edu'.format(j),
+                              j, ['M 0900-1000 AM', 'Tu 0900-1000 AM'])
+
+    def tearDown(self):
+        for k, v in self.saved.items():
+            setattr(assign_students, k, v)
+
+    def test_status_is_the_solvers(self):
+        self.state.solve()
+        status = self.state.status()
+        self.assertEqual(status['last']['status'], backends.OPTIMAL)
+        self.assertEqual(status['last']['backend'], 'flow')
+        self.assertFalse(status['stale'])
+
+    def test_failed_solve_is_stale(self):
+        self.state.solve()
+        placed = dict(self.state.assignment)
+        # closing every section leaves nowhere to place anyone
+        self.state.close([1, 2, 3])
+        self.state.solve()
+        status = self.state.status()
+        self.assertEqual(status['last']['status'], backends.ERROR)
+        self.assertTrue(status['stale'])
+        self.assertEqual(status['assigned'], 3)
+        self.assertEqual(self.state.assignment, placed)
+
+    def test_reopen(self):
+        self.state.close([1])
+        self.state.solve()
+        self.assertEqual(assign_students.SECTIONS['M 0900-1000 AM'], ())
+        self.assertNotIn(1, [s for s, _ in self.state.assignment.values()])
+        self.state.reopen([1])
+        # the others keep their sections, a newcomer gets the reopened one
+        self.state.submit('S3 L3', 's3@x.edu', 3, ['M 0900-1000 AM'])
+        self.state.solve()
+        self.assertEqual(assign_students.SECTIONS['M 0900-1000 AM'], (1,))
+        self.assertEqual(self.state.assignment['s3@x.edu'], (1, 0))
+        self.assertEqual(self.state.status()['closed'], [])
+        self.assertRaises(ValueError, self.state.reopen, [1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+What-if queries against a solved student assignment.
+
+"What if section 22 gets 5 more seats" or "what if we close section 43" used
+to mean editing the catalog and solving again from scratch. Here the cohort
+is solved once, and each question is answered from that optimum by moving
+only the students the change affects: a shrunk or closed slot is emptied
+along shortest paths to free seats (anytime.evict), and any improvement a
+new seat opens up is then found by local search (anytime.improve). Without
+concurrency rows both are exact, so every answer is the objective a full
+re-solve would reach. A change that displaces more than EVICT_MAX students
+is re-solved from scratch instead.
+
+Queries come from -q or, one per line, from stdin:
+
+    prices                  the objective change of one more seat in each
+                            time slot, the dual prices of the slot caps
+    cap SECTION [+|-]N      set a section's capacity, or change it by N
+    close SECTION ...       close sections
+
+Each query is answered against the original solution; queries do not add up.
+"""
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+import anytime
+import assign_students
+import flow
+
+# students a query may move out of shrunk slots one by one; past this a
+# re-solve from scratch is faster
+EVICT_MAX = 100
+
+class WhatIf:
+    """
+    A cohort, its optimal assignment and the section caps it was solved for.
+    """
+
+    def __init__(self, students, prioritize=False):
+        a = assign_students
+        if not a.is_network() or (students.num_sections != 1).any():
+            raise ValueError('what-if queries need one section per student '
+                             'and no concurrent sections')
+        M = students.rankings.shape[1]
+        self.costs = a.make_obj_f(students, prioritize).reshape(-1, M)
+        self.slot_of = dict((s, i) for i, sects in
+                            enumerate(a.SECTIONS.values()) for s in sects)
+        self.caps = dict((s, a.SECTION_CAPS.get(s, a.SECTION_CAP))
+                         for s in self.slot_of)
+        self.x = self.solve(self.slot_caps(self.caps))
+        self.objective = anytime.objective(self.costs, self.x)
+
+    def slot_caps(self, caps):
+        totals = np.zeros(self.costs.shape[1], dtype=np.int64)
+        for s, cap in caps.items():
+            totals[self.slot_of[s]] += cap
+        return totals
+
+    def prices(self):
+        """
+        Returns the objective change of one more seat in each time slot.
+        """
+        return anytime.seat_values(self.costs, self.slot_caps(self.caps),
+                                   self.x)
+
+    def query(self, changes):
+        """
+        changes: section -> new capacity
+        Returns the objective and the assignment with the changed caps.
+        Raises ValueError for unknown sections or if the students no longer
+        fit.
+        """
+        for s in changes:
+            if s not in self.caps:
+                raise ValueError('unknown section: {0}'.format(s))
+        caps = dict(self.caps)
+        caps.update(changes)
+        old, caps = self.slot_caps(self.caps), self.slot_caps(caps)
+        if caps.sum() < len(self.x):
+            raise ValueError('{0} seats left for {1} students'.format(
+                caps.sum(), len(self.x)))
+        excess = np.maximum(self.x.sum(axis=0) - caps, 0).sum()
+        if excess > EVICT_MAX:
+            x = self.solve(caps)
+        else:
+            x = self.x.copy()
+            # shrinking first keeps x optimal at every step, new seats are
+            # only put to use after
+            anytime.evict(self.costs, np.minimum(old, caps), x)
+            anytime.improve(self.costs, caps, x)
+        return anytime.objective(self.costs, x), x
+
+    def solve(self, caps):
+        """
+        Returns the optimal assignment for the slot caps from scratch.
+        """
+        assignment, _ = flow.min_cost_assignment(self.costs.tolist(),
+                                                 caps.tolist())
+        x = np.zeros(self.costs.shape, dtype=bool)
+        for j, slots in enumerate(assignment):
+            x[j, slots] = True
+        return x
+
+    def parse(self, line):
+        """
+        Returns the capacity changes of a cap or close query.
+        """
+        words = line.split()
+        if words[0] == 'cap' and len(words) == 3:
+            s, n = int(words[1]), words[2]
+            if s not in self.caps:
+                raise ValueError('unknown section: {0}'.format(s))
+            cap = self.caps[s] + int(n) if n[0] in '+-' else int(n)
+            return {s: max(cap, 0)}
+        if words[0] == 'close' and len(words) > 1:
+            return dict((int(s), 0) for s in words[1:])
+        raise ValueError('bad query: {0}'.format(line))
+
+    def answer(self, line, out=sys.stdout):
+        line = line.strip()
+        if not line:
+            return
+        if line == 'prices':
+            for (slot, sects), value in zip(
+                    assign_students.SECTIONS.items(), self.prices().tolist()):
+                print >>out, '{0} {1}: {2:g}'.format(slot, sects, value)
+            return
+        start = time.time()
+        objective, x = self.query(self.parse(line))
+        moved = (x != self.x).any(axis=1).sum()
+        print >>out, '{0}: objective {1} -> {2} ({3:+d}), {4} students ' \
+                     'move, {5:.3f}s'.format(line, self.objective, objective,
+                                             int(objective - self.objective),
+                                             moved, time.time() - start)
+
+def main(csv_file, prioritize, queries):
+    students = assign_students.import_students(csv_file, prioritize)
+    whatif = WhatIf(students, prioritize)
+    print 'objective {0}'.format(whatif.objective)
+    for line in queries or sys.stdin:
+        try:
+            whatif.answer(line)
+        except ValueError as e:
+            print >>sys.stderr, e
+        sys.stdout.flush()
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='answers what-if questions about section capacities')
+    parser.add_argument('-p', '--prioritize', action='store_true', help='give students with seniority priority')
+    parser.add_argument('-q', '--query', action='append', metavar='QUERY', help="a query such as 'prices', 'cap 22 +5' or 'close 43', read from stdin if none")
+    parser.add_argument('csv_file', help='csv file with section rankings')
+    args = parser.parse_args()
+    main(args.csv_file, args.prioritize, args.query)